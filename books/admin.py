@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Book, Student, Borrow, Author, Subject
+from .models import Book, Student, Borrow, Author, Subject, OutboundEmail
 
 # Register simple models
 admin.site.register(Student)
@@ -11,11 +11,10 @@ admin.site.register(Subject)
 class BookAdmin(admin.ModelAdmin):
     list_display = ('title', 'publication_year', 'quantity_status')
     search_fields = ('title',)
-    
+
     def quantity_status(self, obj):
-        # Calculate availability for the admin list view
-        active = Borrow.objects.filter(borrowing=obj, returned=False).count()
-        available = max(0, obj.quantity - active)
+        # Availability is read from the denormalized Book.active_loans counter
+        available = obj.available_copies
         
         color = "green" if available > 0 else "red"
         return format_html(
@@ -63,4 +62,12 @@ class BorrowAdmin(admin.ModelAdmin):
     
     daily_limit_info.short_description = "📊 Daily Borrow Limit Status"
 
-admin.site.register(Borrow, BorrowAdmin)
\ No newline at end of file
+admin.site.register(Borrow, BorrowAdmin)
+
+# Register the email outbox so stuck or failed notices can be inspected
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'dedupe_key')
+
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""Query-count and latency regression suite for every route in books/urls.py.
+
+run_suite() requests each endpoint through the test client against the
+data already in the database (normally a seeding.seed_library() library),
+clearing the response cache before every request so each one pays its full
+cost, and runs send_overdue_notices the same way. The report holds the SQL
+queries and the p50/max wall-clock milliseconds of each.
+
+compare() checks a report against the committed baseline
+(benchmark_baseline.json). Query counts must never grow; a view without an
+N+1 issues the same number of queries however big the library is, so they
+are compared at any size. Latency is only compared when the report was
+taken at the baseline's sizes on the same database vendor.
+"""
+import json
+import statistics
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Exists, F, OuterRef
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import jobs
+from .caching import get_cache
+from .models import BackgroundJob, Book, Borrow, Student
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+PASSWORD = 'benchmark-password'
+# Latency fails when it exceeds baseline * tolerance + slack
+LATENCY_TOLERANCE = 2.0
+LATENCY_SLACK_MS = 5.0
+
+
+def fixtures():
+    """Rows the cases point at; raises LookupError if the library is too small to have them."""
+    open_loan = Borrow.objects.filter(returned=False).order_by('id').values('borrowing_id', 'borrower__tup_id').first()
+    free_students = list(
+        Student.objects.exclude(Exists(Borrow.objects.filter(borrower=OuterRef('pk'), returned=False)))
+        .order_by('id').values_list('tup_id', flat=True)[:2]
+    )
+    free_books = list(Book.objects.filter(active_loans__lt=F('quantity')).order_by('id').values_list('id', 'title')[:2])
+    if open_loan is None or len(free_students) < 2 or len(free_books) < 2:
+        raise LookupError("Needs an open loan and two students and books without one; seed a library first")
+
+    user, _ = get_user_model().objects.get_or_create(username='benchmark')
+    user.set_password(PASSWORD)
+    user.save()
+    job = BackgroundJob.objects.create(kind='send_overdue_notices', status=BackgroundJob.SUCCEEDED)
+    tup_id = open_loan['borrower__tup_id']
+    return {
+        'book': open_loan['borrowing_id'],
+        'tup_id': tup_id,
+        'short_id': tup_id[len('TUPM-'):],
+        'word': free_books[0][1].split()[0],
+        'job': job.pk,
+        'borrow': {'tup_id': free_students[0], 'book_ids': [free_books[0][0]]},
+        'cart': {'tup_id': free_students[1], 'book_ids': [free_books[1][0]]},
+    }
+
+
+def cases(f):
+    """(report name, url name, method, path, data) in run order; borrows come before their returns."""
+    def url(name, *args):
+        return reverse(f'library:{name}', args=args)
+
+    year, digits = f['short_id'].split('-')
+    return [
+        ('index', 'index', 'get', url('index'), None),
+        ('index lookup', 'index', 'post', url('index'), {'tup_id_year': year, 'tup_id_digits': digits}),
+        ('book', 'book', 'get', url('book', f['book']), None),
+        ('student', 'student', 'get', url('student', f['tup_id']), None),
+        ('books-lists', 'books-lists', 'get', url('books-lists'), None),
+        ('book-details', 'book-details', 'get', url('book-details', f['book']), None),
+        ('student-history', 'student-history', 'get', url('student-history', f['tup_id']), None),
+        ('api_book_list', 'api_book_list', 'get', url('api_book_list'), None),
+        ('api_book_list page', 'api_book_list', 'get', url('api_book_list') + '?page_size=50', None),
+        ('api_book_detail', 'api_book_detail', 'get', url('api_book_detail', f['book']), None),
+        # Measured against the suite's local-memory cache, so this is the 501 refusal
+        ('api_cache_metrics', 'api_cache_metrics', 'get', url('api_cache_metrics'), None),
+        ('api_book_search', 'api_book_search', 'get', url('api_book_search') + f"?q={f['word']}", None),
+        ('api_student_history', 'api_student_history', 'get', url('api_student_history', f['tup_id']), None),
+        ('api_changes', 'api_changes', 'get', url('api_changes'), None),
+        ('api_circulation borrow', 'api_circulation', 'post', url('api_circulation'), {'action': 'borrow', **f['borrow']}),
+        ('api_circulation return', 'api_circulation', 'post', url('api_circulation'), {'action': 'return', **f['borrow']}),
+        ('api_circulation_batch borrow', 'api_circulation_batch', 'post', url('api_circulation_batch'),
+         {'action': 'borrow', 'carts': [f['cart']]}),
+        ('api_circulation_batch return', 'api_circulation_batch', 'post', url('api_circulation_batch'),
+         {'action': 'return', 'carts': [f['cart']]}),
+        ('api_student_list', 'api_student_list', 'get', url('api_student_list'), None),
+        ('api_student_list page', 'api_student_list', 'get', url('api_student_list') + '?page_size=50', None),
+        ('api_login', 'api_login', 'post', url('api_login'), {'username': 'benchmark', 'password': PASSWORD}),
+        ('admin-dashboard', 'admin-dashboard', 'get', url('admin-dashboard'), None),
+        # The test client is a WSGI handler, so this measures the 501 refusal, not a stream
+        ('dashboard-events', 'dashboard-events', 'get', url('dashboard-events'), None),
+        ('trigger-emails', 'trigger-emails', 'post', url('trigger-emails'), None),
+        ('job-status', 'job-status', 'get', url('job-status', f['job']), None),
+        ('api_async_book_list', 'api_async_book_list', 'get', url('api_async_book_list'), None),
+        ('api_async_book_detail', 'api_async_book_detail', 'get', url('api_async_book_detail', f['book']), None),
+        ('api_async_student_history', 'api_async_student_history', 'get',
+         url('api_async_student_history', f['tup_id']), None),
+        ('api_async_admin_dashboard', 'api_async_admin_dashboard', 'get', url('api_async_admin_dashboard'), None),
+    ]
+
+
+def _request(client, method, path, data):
+    if method == 'get':
+        return client.get(path)
+    if path == reverse('library:index'):
+        return client.post(path, data)
+    return client.post(path, data, content_type='application/json')
+
+
+def _send_overdue_notices():
+    call_command('send_overdue_notices', stdout=StringIO())
+
+
+def run_suite(repeat=5):
+    """{name: {url, method, path, status, queries, p50_ms, max_ms}} for every case plus send_overdue_notices.
+
+    Every case runs once unmeasured, then repeat measured rounds; queries is
+    the most any measured round issued.
+    """
+    client = Client()
+    planned = cases(fixtures())
+    results = {
+        name: {'url': url_name, 'method': method.upper(), 'path': path, 'status': None}
+        for name, url_name, method, path, _ in planned
+    }
+    results['send_overdue_notices'] = {'url': None, 'method': 'COMMAND', 'path': 'send_overdue_notices', 'status': None}
+    samples = {name: [] for name in results}
+
+    # Overdue notices (the command and trigger-emails' job) go to memory, not the console
+    with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+        for measured in [False] + [True] * repeat:
+            for name, _, method, path, data in planned:
+                get_cache().clear()
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = _request(client, method, path, data)
+                    elapsed = time.perf_counter() - started
+                if name == 'trigger-emails':
+                    # Let the job it queued finish before timing anything else
+                    jobs._executor.submit(lambda: None).result()
+                results[name]['status'] = response.status_code
+                if measured:
+                    samples[name].append((len(queries), elapsed))
+
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                _send_overdue_notices()
+                elapsed = time.perf_counter() - started
+            if measured:
+                samples['send_overdue_notices'].append((len(queries), elapsed))
+            mail.outbox = []
+
+    for name, runs in samples.items():
+        results[name].update(
+            queries=max(count for count, _ in runs),
+            p50_ms=round(statistics.median(elapsed for _, elapsed in runs) * 1000, 2),
+            max_ms=round(max(elapsed for _, elapsed in runs) * 1000, 2),
+        )
+    return results
+
+
+def report(results, sizes, seed, repeat):
+    return {
+        'database': connection.vendor,
+        'sizes': sizes,
+        'seed': seed,
+        'repeat': repeat,
+        'endpoints': results,
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current, baseline, tolerance=LATENCY_TOLERANCE, slack_ms=LATENCY_SLACK_MS):
+    """Regressions of current against baseline, one message each; empty when there are none."""
+    same_setup = current['database'] == baseline['database'] and current['sizes'] == baseline['sizes']
+    regressions = []
+    for name, result in current['endpoints'].items():
+        expected = baseline['endpoints'].get(name)
+        if expected is None:
+            continue
+        if result['status'] != expected['status']:
+            regressions.append(f"{name}: status {result['status']}, baseline {expected['status']}")
+        if result['queries'] > expected['queries']:
+            regressions.append(f"{name}: {result['queries']} queries, baseline {expected['queries']}")
+        if same_setup and result['p50_ms'] > expected['p50_ms'] * tolerance + slack_ms:
+            regressions.append(f"{name}: p50 {result['p50_ms']:.1f} ms, baseline {expected['p50_ms']:.1f} ms")
+    for name in baseline['endpoints'].keys() - current['endpoints'].keys():
+        regressions.append(f"{name}: missing from the report")
+    return regressions
@@ -0,0 +1,155 @@
+"""Response cache for the catalog read endpoints.
+
+Rendered responses are stored in the Django cache (settings.CATALOG_CACHE,
+the 'default' alias unless configured) keyed by path, query string, Accept
+header and the DataVersion of every data set the response depends on:
+'catalog' for anything in the catalog listing, 'book:<pk>' for one book's
+details. Writes never delete entries; signals.py and circulation.py bump
+the affected versions on commit, so stale keys are simply never read again
+and expire on their own. The versions live in the database, so every
+worker sees a bump at once even when each keeps its own local-memory cache.
+
+Conditional requests are answered from the ETag alone: the versions carry
+no time, and a Last-Modified with one-second resolution would call a
+response written in the same second as a later write unmodified.
+
+The hit/miss counters are only kept in a cache every worker shares; a
+local-memory cache would count one process at a time, so cache_metrics
+refuses to serve them.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+ENTRY_TIMEOUT = 60 * 60
+METRICS = ('hits', 'misses', 'not_modified')
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE', 'default')]
+
+
+def is_shared():
+    """False when every worker process keeps its own copy of the cache."""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def is_anonymous(request):
+    """True when neither the session nor an Authorization header (DRF's default authenticators) names a user."""
+    if request.META.get('HTTP_AUTHORIZATION'):
+        return False
+    user = getattr(request, 'user', None)
+    return user is None or not user.is_authenticated
+
+
+def book_version(pk):
+    return f"book:{pk}"
+
+
+def invalidate_books(book_ids):
+    """Invalidate the details of book_ids once the current transaction commits.
+
+    The listing is keyed on DataVersion.CATALOG, which the writers bump themselves.
+    """
+    from .models import DataVersion
+    if book_ids:
+        DataVersion.bump(*{book_version(pk) for pk in book_ids})
+
+
+def record(endpoint, metric):
+    if not is_shared():
+        return
+    cache = get_cache()
+    key = f"catalog-metric:{endpoint}:{metric}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, None)
+
+
+def metrics():
+    """[(endpoint, metric, value)] for every endpoint that has served a request."""
+    cache = get_cache()
+    endpoints = sorted(cache.get('catalog-metric-endpoints', set()))
+    keys = [f"catalog-metric:{endpoint}:{metric}" for endpoint in endpoints for metric in METRICS]
+    values = cache.get_many(keys)
+    return [
+        (endpoint, metric, values.get(f"catalog-metric:{endpoint}:{metric}", 0))
+        for endpoint in endpoints for metric in METRICS
+    ]
+
+
+class CachedResponseMixin:
+    """Serve GET/HEAD from the response cache, with ETags and 304s.
+
+    Views set cache_name (the metrics label) and override cache_scopes()
+    with the DataVersion names they depend on when that is narrower than
+    the whole catalog.
+
+    The cache is consulted before DRF authenticates the request, so only
+    anonymous requests use it and only JSON renders are stored: the
+    browsable API page carries the user's name and a CSRF token.
+    """
+    cache_name = None
+
+    def cache_scopes(self, **kwargs):
+        from .models import DataVersion
+        return [DataVersion.CATALOG]
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not is_anonymous(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        from .models import DataVersion
+        cache = get_cache()
+        scopes = self.cache_scopes(**kwargs)
+        versions = DataVersion.current(*scopes) if scopes else {}
+        raw_key = "|".join([
+            request.path,
+            request.META.get('QUERY_STRING', ''),
+            request.META.get('HTTP_ACCEPT', ''),
+            getattr(self, 'version_tag', ''),
+            *(f"{scope}={version}" for scope, version in sorted(versions.items())),
+        ])
+        key = "catalog-response:" + hashlib.md5(raw_key.encode()).hexdigest()
+
+        entry = cache.get(key)
+        if entry is None:
+            response = super().dispatch(request, *args, **kwargs)
+            renderer = getattr(response, 'accepted_renderer', None)
+            if response.status_code != 200 or getattr(renderer, 'format', None) != 'json':
+                return response
+            response.render()
+            entry = {
+                "content": response.content,
+                "content_type": response['Content-Type'],
+                "etag": '"%s"' % hashlib.md5(response.content).hexdigest(),
+            }
+            cache.set(key, entry, ENTRY_TIMEOUT)
+            self.record('misses')
+        else:
+            self.record('hits')
+
+        response = get_conditional_response(request, etag=entry["etag"])
+        if response is not None:
+            self.record('not_modified')
+        else:
+            response = HttpResponse(entry["content"], content_type=entry["content_type"])
+        response['ETag'] = entry["etag"]
+        return response
+
+    def record(self, metric):
+        if not is_shared():
+            return
+        cache = get_cache()
+        endpoints = cache.get('catalog-metric-endpoints', set())
+        if self.cache_name not in endpoints:
+            cache.set('catalog-metric-endpoints', endpoints | {self.cache_name}, None)
+        record(self.cache_name, metric)
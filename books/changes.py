@@ -0,0 +1,82 @@
+"""Changes feed: Book and Borrow rows written since a cursor.
+
+Both tables carry an indexed (updated_at, id), so each poll is two keyset
+range scans. The cursor records the last (updated_at, id) delivered from
+each table. Rows younger than SETTLE are held back to the next poll: a
+transaction that stamped updated_at earlier but commits later would
+otherwise land behind a cursor that already moved past it, and never be
+delivered.
+
+updated_at is stamped in Python before the row is written, so the gap
+between the stamp and the commit includes any wait for a lock: SQLite's
+busy timeout on an autocommit save, a select_for_update() on Postgres.
+Both give up after settings.DATABASE_LOCK_TIMEOUT, so SETTLE is that plus
+a margin for the transaction's own work. The feed runs that far behind the
+database; a write slower than SETTLE in total (several lock waits in one
+transaction) can still be missed, and a full resync (no ?since=) recovers.
+
+Deletes are not reported; circulation never deletes, so a client only
+needs a full resync (no ?since=) after admin clean-ups.
+"""
+import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Book, Borrow
+from .pagination import decode_cursor, encode_cursor
+
+SETTLE = datetime.timedelta(seconds=getattr(settings, 'DATABASE_LOCK_TIMEOUT', 20) + 5)
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _after(queryset, position, horizon, limit):
+    updated_at, pk = position
+    rows = list(
+        queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk), updated_at__lte=horizon)
+        .order_by('updated_at', 'id')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        position = (rows[-1].updated_at, rows[-1].pk)
+    return rows, position, has_more
+
+
+def parse_changes_cursor(cursor):
+    """((book_updated_at, book_id), (borrow_updated_at, borrow_id)); the epoch when cursor is empty."""
+    if not cursor:
+        return (EPOCH, 0), (EPOCH, 0)
+    parts = decode_cursor(cursor)
+    if not parts or len(parts) != 4:
+        raise ValidationError("Invalid cursor")
+    try:
+        book_at, borrow_at = parse_datetime(parts[0]), parse_datetime(parts[2])
+        positions = (book_at, int(parts[1])), (borrow_at, int(parts[3]))
+    except ValueError:
+        raise ValidationError("Invalid cursor")
+    if book_at is None or borrow_at is None:
+        raise ValidationError("Invalid cursor")
+    return positions
+
+
+def changes_since(cursor, limit):
+    """Return (books, borrows, next_cursor, has_more) for up to limit rows of each table."""
+    book_position, borrow_position = parse_changes_cursor(cursor)
+    horizon = timezone.now() - SETTLE
+
+    books, book_position, more_books = _after(
+        Book.objects.with_availability(), book_position, horizon, limit
+    )
+    borrows, borrow_position, more_borrows = _after(
+        Borrow.objects.select_related('borrower', 'borrowing').only(
+            'borrower__first', 'borrower__last', 'borrower__tup_id', 'borrowing__title',
+            'borrowed_date', 'due_date', 'returned', 'updated_at',
+        ),
+        borrow_position, horizon, limit,
+    )
+    next_cursor = encode_cursor(*book_position, *borrow_position)
+    return books, borrows, next_cursor, more_books or more_borrows
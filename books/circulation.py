@@ -0,0 +1,204 @@
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .caching import invalidate_books
+from .events import publish_loan_events
+from .models import Book, Borrow, DailyBorrower, DailyBorrowStats, DataVersion, OutboundEmail, Student
+
+
+def borrow_book(student, book):
+    """Check out one copy of book to student.
+
+    Runs in one transaction holding row locks on the student (serializes the
+    per-student limits across desk terminals) and the book (serializes the
+    copy count). Raises ValidationError with code 'already_borrowed',
+    'unavailable' or the model's own validation message.
+    """
+    with transaction.atomic():
+        student = Student.objects.select_for_update().get(pk=student.pk)
+        book = Book.objects.select_for_update().get(pk=book.pk)
+
+        if Borrow.objects.filter(borrower=student, borrowing=book, returned=False).exists():
+            raise ValidationError("Already borrowed", code='already_borrowed')
+
+        if not book.is_available:
+            raise ValidationError("All copies are currently borrowed", code='unavailable')
+
+        borrow = Borrow(borrower=student, borrowing=book)
+        borrow.full_clean()
+        borrow.save()
+    return borrow
+
+
+def return_book(student, book):
+    """Close student's open loan of book. Returns the Borrow, or None if there was none.
+
+    Locks the student, then the book, then the loan: the order borrow_book()
+    and process_carts() take them in, so a return never deadlocks against a
+    checkout or a cart on the same book.
+    """
+    with transaction.atomic():
+        Student.objects.select_for_update().get(pk=student.pk)
+        Book.objects.select_for_update().get(pk=book.pk)
+        record = Borrow.objects.select_for_update().filter(
+            borrower=student, borrowing=book, returned=False
+        ).order_by('pk').first()
+        if record is None:
+            return None
+        record.returned = True
+        record.save()
+    return record
+
+
+def _adjust_active_loans(deltas):
+    """Apply {book_id: delta} to Book.active_loans in a single UPDATE."""
+    deltas = {book_id: delta for book_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # bulk_create/bulk_update send no signals, so do the signal handlers' work here
+    DataVersion.bump(DataVersion.CATALOG, DataVersion.CIRCULATION)
+    invalidate_books(deltas)
+    Book.objects.filter(pk__in=deltas).update(
+        active_loans=Case(
+            *[When(pk=book_id, then=F('active_loans') + delta) for book_id, delta in deltas.items()],
+            default=F('active_loans'),
+            output_field=Book._meta.get_field('active_loans'),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def process_carts(action, carts):
+    """Borrow or return many carts in one transaction with a constant number of queries.
+
+    carts is a list of {"tup_id": ..., "book_ids": [...]}. Students, books and
+    their open loans are each fetched (and locked) with one query, limits are
+    checked in memory, and the writes go out as one bulk_create/bulk_update,
+    one counter UPDATE, the daily-limit rows and one outbox INSERT. Returns
+    one {"tup_id", "results"} entry per cart, where results are the same
+    per-book messages CirculationView produces.
+    """
+    tup_ids = {cart.get('tup_id') for cart in carts}
+    book_ids = {_book_pk(book_id) for cart in carts for book_id in cart.get('book_ids', [])} - {None}
+
+    with transaction.atomic():
+        students = {s.tup_id: s for s in Student.objects.select_for_update().filter(tup_id__in=tup_ids).order_by('pk')}
+        books = {b.pk: b for b in Book.objects.select_for_update().filter(pk__in=book_ids).order_by('pk')}
+        open_loans = {
+            (loan.borrower_id, loan.borrowing_id): loan
+            for loan in Borrow.objects.select_for_update().filter(
+                borrower__in=students.values(), returned=False
+            ).order_by('pk')
+        }
+
+        if action == 'borrow':
+            # Lock today's counter row so the in-memory daily limit check is authoritative
+            today = timezone.localdate()
+            stats, _ = DailyBorrowStats.objects.select_for_update().get_or_create(day=today)
+            borrowed_today = set(
+                DailyBorrower.objects.filter(day=today, student__in=students.values()).values_list('student_id', flat=True)
+            )
+
+            output, created = _borrow_carts(carts, students, books, open_loans, borrowed_today, stats.borrower_count)
+            Borrow.objects.bulk_create(created)
+            new_borrowers = {borrow.borrower_id for borrow in created} - borrowed_today
+            if new_borrowers:
+                DailyBorrower.objects.bulk_create([DailyBorrower(day=today, student_id=pk) for pk in new_borrowers])
+                DailyBorrowStats.objects.filter(pk=stats.pk).update(borrower_count=F('borrower_count') + len(new_borrowers))
+            _adjust_active_loans(Counter(borrow.borrowing_id for borrow in created))
+            OutboundEmail.enqueue_many(
+                (borrow.borrow_confirmation_message(), borrow.borrow_confirmation_key()) for borrow in created
+            )
+            publish_loan_events('borrow', created)
+        else:
+            output, closed = _return_carts(carts, students, books, open_loans)
+            Borrow.objects.bulk_update(closed, ['returned', 'updated_at'])
+            _adjust_active_loans({book_id: -count for book_id, count in Counter(loan.borrowing_id for loan in closed).items()})
+            publish_loan_events('return', closed)
+    return output
+
+
+def _book_pk(book_id):
+    try:
+        return int(book_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _cart_items(cart, students, books):
+    student = students.get(cart.get('tup_id'))
+    return student, [(book_id, books.get(_book_pk(book_id))) for book_id in cart.get('book_ids', [])]
+
+
+def _borrow_carts(carts, students, books, open_loans, borrowed_today, distinct_today):
+    active_per_student = Counter(borrower_id for borrower_id, _ in open_loans)
+    claimed = Counter()
+    borrowed_today = set(borrowed_today)
+
+    output, created = [], []
+    for cart in carts:
+        student, items = _cart_items(cart, students, books)
+        results = []
+        if student is None:
+            output.append({"tup_id": cart.get('tup_id'), "results": ["⚠️ Student not found"]})
+            continue
+
+        for book_id, book in items:
+            if book is None:
+                results.append(f"⚠️ Book {book_id}: Not found")
+                continue
+            if (student.pk, book.pk) in open_loans:
+                results.append(f"❌{book.title}: Already borrowed")
+                continue
+            if book.active_loans + claimed[book.pk] >= book.quantity:
+                results.append(f"⛔ {book.title}: All copies are currently borrowed")
+                continue
+            if active_per_student[student.pk] >= Borrow.MAX_ACTIVE_LOANS:
+                results.append(f"⛔ {book.title}: Failed - {Borrow.loan_limit_message(student)}")
+                continue
+            if student.pk not in borrowed_today and distinct_today >= Borrow.DAILY_LIMIT:
+                results.append(f"⛔ {book.title}: Failed - {Borrow.daily_limit_message()}")
+                continue
+
+            borrow = Borrow(borrower=student, borrowing=book)
+            borrow.set_default_due_date()
+            created.append(borrow)
+            open_loans[(student.pk, book.pk)] = borrow
+            active_per_student[student.pk] += 1
+            claimed[book.pk] += 1
+            if student.pk not in borrowed_today:
+                borrowed_today.add(student.pk)
+                distinct_today += 1
+            results.append(f"✅ {book.title}: Successfully Borrowed")
+        output.append({"tup_id": student.tup_id, "results": results})
+    return output, created
+
+
+def _return_carts(carts, students, books, open_loans):
+    output, closed = [], []
+    for cart in carts:
+        student, items = _cart_items(cart, students, books)
+        results = []
+        if student is None:
+            output.append({"tup_id": cart.get('tup_id'), "results": ["⚠️ Student not found"]})
+            continue
+
+        for book_id, book in items:
+            if book is None:
+                results.append(f"⚠️ Book {book_id}: Not found")
+                continue
+            loan = open_loans.pop((student.pk, book.pk), None)
+            if loan is None:
+                results.append(f"⚠️ {book.title}: Was not borrowed by this student")
+                continue
+            loan.returned = True
+            loan.updated_at = timezone.now()
+            loan.borrower, loan.borrowing = student, book
+            closed.append(loan)
+            results.append(f"↩️ {book.title}: Successfully Returned")
+        output.append({"tup_id": student.tup_id, "results": results})
+    return output, closed
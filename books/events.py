@@ -0,0 +1,175 @@
+"""Live circulation events for the admin dashboard (server-sent events).
+
+Writers publish 'borrow' and 'return' events through the configured broker
+once their transaction commits. The broker hands every event to deliver(),
+which fans it out to the asyncio queue of each open /api/admin-dashboard/events/
+stream in this process. Each stream is a coroutine parked on its queue, so
+idle connections cost a queue and a socket, not a thread; serve the project
+through library/asgi.py for that to hold. Under WSGI the route answers 501
+and the dashboard keeps polling /api/admin-dashboard/.
+
+'overdue' events need no write: while anyone is listening, each process
+polls the open-loans due_date index every OVERDUE_POLL_SECONDS and reports
+loans that have just passed due to its own listeners.
+
+settings.EVENT_BROKER names the broker class. LocalBroker only reaches
+streams in the publishing process; a multi-process deployment plugs in a
+Broker subclass backed by e.g. Redis pub/sub.
+"""
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Borrow
+
+QUEUE_SIZE = 100
+KEEPALIVE_SECONDS = 15
+OVERDUE_POLL_SECONDS = 30
+
+
+class Broker(ABC):
+    """Carries events between processes.
+
+    publish() sends an event to every process; start(deliver) is called once
+    per process and must arrange for deliver(event) to run for each event
+    published anywhere, including this process.
+    """
+
+    @abstractmethod
+    def start(self, deliver):
+        ...
+
+    @abstractmethod
+    def publish(self, event):
+        ...
+
+
+class LocalBroker(Broker):
+    """In-process stand-in: publishing is delivering."""
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, event):
+        self.deliver(event)
+
+
+class EventHub:
+    """Fans events out to the subscriber queues of this process, whatever loop they live on."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._watchers = {}
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = loop
+            if loop not in self._watchers:
+                self._watchers[loop] = loop.create_task(self._watch_overdue(loop))
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            loop = self._subscribers.pop(queue, None)
+            if loop is not None and loop not in self._subscribers.values():
+                watcher = self._watchers.pop(loop, None)
+                if watcher is not None:
+                    watcher.cancel()
+
+    def deliver(self, event, loop=None):
+        """Queue event for every subscriber (only those on loop, if given). Safe from any thread."""
+        with self._lock:
+            subscribers = [(queue, l) for queue, l in self._subscribers.items() if loop is None or l is loop]
+        for queue, subscriber_loop in subscribers:
+            try:
+                subscriber_loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                # Loop already closed; its stream is being torn down
+                pass
+
+    @staticmethod
+    def _offer(queue, event):
+        if queue.full():
+            # A stalled client gets one resync instead of an unbounded backlog
+            while not queue.empty():
+                queue.get_nowait()
+            event = {"type": "resync"}
+        queue.put_nowait(event)
+
+    async def _watch_overdue(self, loop):
+        since = timezone.now()
+        while True:
+            await asyncio.sleep(OVERDUE_POLL_SECONDS)
+            now = timezone.now()
+            loans = Borrow.objects.filter(returned=False, due_date__gt=since, due_date__lte=now).select_related('borrower', 'borrowing')
+            async for borrow in loans.order_by('due_date', 'id'):
+                self.deliver(loan_event('overdue', borrow), loop=loop)
+            since = now
+
+
+def loan_event(kind, borrow):
+    return {
+        "type": kind,
+        "id": borrow.pk,
+        "book_id": borrow.borrowing_id,
+        "book_title": borrow.borrowing.title,
+        "student_name": f"{borrow.borrower.first} {borrow.borrower.last}",
+        "student_id": borrow.borrower.tup_id,
+        "due_date": borrow.due_date.isoformat() if borrow.due_date else None,
+    }
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+hub = EventHub()
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'EVENT_BROKER', 'books.events.LocalBroker'))()
+            _broker.start(hub.deliver)
+    return _broker
+
+
+def publish_loan_events(kind, borrows):
+    """Publish one event per borrow after the current transaction commits."""
+    events = [loan_event(kind, borrow) for borrow in borrows]
+
+    def publish():
+        broker = get_broker()
+        for event in events:
+            broker.publish(event)
+
+    if events:
+        transaction.on_commit(publish)
+
+
+async def stream_events():
+    """SSE body for one subscriber, subscribed from its first chunk until the client goes away."""
+    queue = hub.subscribe()
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        hub.unsubscribe(queue)
@@ -0,0 +1,56 @@
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import call_command
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+# One background thread per worker process is enough for the occasional bulk
+# email run and keeps it from competing with circulation traffic.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='library-jobs')
+
+# A queued/running job older than this is assumed lost with its process
+STALE_AFTER = datetime.timedelta(hours=1)
+
+# kind -> callable(job) doing the work and reporting progress on the job row
+JOB_RUNNERS = {
+    'send_overdue_notices': lambda job: call_command('send_overdue_notices', job=job.pk),
+}
+
+
+def submit_job(kind):
+    """Queue a job of the given kind, reusing one that is already queued or running."""
+    with transaction.atomic():
+        job = BackgroundJob.objects.select_for_update().filter(
+            kind=kind,
+            status__in=[BackgroundJob.QUEUED, BackgroundJob.RUNNING],
+            created_at__gte=timezone.now() - STALE_AFTER,
+        ).order_by('-created_at').first()
+        if job is None:
+            job = BackgroundJob.objects.create(kind=kind)
+            transaction.on_commit(lambda: _executor.submit(run_job, job.pk))
+    return job
+
+
+def run_job(job_id):
+    close_old_connections()
+    try:
+        job = BackgroundJob.objects.get(pk=job_id)
+        BackgroundJob.objects.filter(pk=job_id).update(status=BackgroundJob.RUNNING, started_at=timezone.now())
+        try:
+            JOB_RUNNERS[job.kind](job)
+        except Exception as e:
+            logger.exception("Background job %s failed", job_id)
+            BackgroundJob.objects.filter(pk=job_id).update(
+                status=BackgroundJob.FAILED, error=str(e), finished_at=timezone.now()
+            )
+        else:
+            BackgroundJob.objects.filter(pk=job_id).update(status=BackgroundJob.SUCCEEDED, finished_at=timezone.now())
+    finally:
+        # This thread's connections would otherwise idle until conn_max_age
+        connections.close_all()
@@ -0,0 +1,136 @@
+import http.client
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from books.models import Book, Borrow
+
+# (name, sync path, async path); {book} and {tup_id} are filled from the database
+ENDPOINTS = [
+    ('book list', '/books/api/books/', '/books/api/async/books/'),
+    ('book detail', '/books/api/books/{book}/', '/books/api/async/books/{book}/'),
+    ('history', '/books/api/history/{tup_id}/', '/books/api/async/history/{tup_id}/'),
+    ('dashboard', '/books/api/admin-dashboard/', '/books/api/async/admin-dashboard/'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compares requests/sec and latency of the sync API under gunicorn with the async API under uvicorn workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint per server')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent client connections')
+        parser.add_argument('--workers', type=int, default=2, help='Worker processes per server')
+        parser.add_argument('--sync-url', help='Benchmark an already running sync server instead of starting gunicorn')
+        parser.add_argument('--async-url', help='Benchmark an already running ASGI server instead of starting uvicorn workers')
+        parser.add_argument('--cold', action='store_true', help='Add a unique query param per request so the response cache never hits')
+
+    def handle(self, *args, **options):
+        book = Book.objects.order_by('id').values_list('id', flat=True).first()
+        tup_id = Borrow.objects.order_by('-id').values_list('borrower__tup_id', flat=True).first()
+        if book is None or tup_id is None:
+            raise CommandError('Needs at least one book and one borrow; seed the database first.')
+        paths = [(name, sync.format(book=book, tup_id=tup_id), asynchronous.format(book=book, tup_id=tup_id))
+                 for name, sync, asynchronous in ENDPOINTS]
+
+        servers = []
+        try:
+            sync_url = options['sync_url'] or self.start_server(servers, 'library.wsgi:application', [], options['workers'])
+            async_url = options['async_url'] or self.start_server(
+                servers, 'library.asgi:application', ['-k', 'uvicorn.workers.UvicornWorker'], options['workers']
+            )
+
+            self.stdout.write(
+                f"{options['requests']} requests per endpoint, {options['concurrency']} connections"
+                f"{', cold cache' if options['cold'] else ''}\n"
+            )
+            self.stdout.write(f"{'endpoint':<12} {'server':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+            for name, sync_path, async_path in paths:
+                for label, base_url, path in (('sync', sync_url, sync_path), ('async', async_url, async_path)):
+                    result = self.load(base_url, path, options['requests'], options['concurrency'], options['cold'])
+                    style = self.style.SUCCESS if not result['errors'] else self.style.WARNING
+                    self.stdout.write(style(
+                        f"{name:<12} {label:<6} {result['rps']:>8.1f} {result['p50']:>8.1f} "
+                        f"{result['p99']:>8.1f} {result['errors']:>7}"
+                    ))
+        finally:
+            for server in servers:
+                server.terminate()
+                server.wait(timeout=10)
+
+    def start_server(self, servers, app, extra_args, workers):
+        port = self.free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', app, '-w', str(workers), '-b', f'127.0.0.1:{port}', '--log-level', 'warning', *extra_args],
+            cwd=settings.BASE_DIR, env=os.environ.copy(),
+        )
+        servers.append(server)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'{app} exited with status {server.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return f'http://127.0.0.1:{port}'
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f'{app} did not start listening on port {port}')
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def load(self, base_url, path, total, concurrency, cold):
+        """Send total GETs over concurrency keep-alive connections; returns req/s, p50/p99 ms and errors."""
+        url = urlsplit(base_url)
+        counter = itertools.count()
+        lock = threading.Lock()
+        latencies, errors = [], [0]
+
+        def client():
+            connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+            try:
+                while True:
+                    with lock:
+                        n = next(counter)
+                    if n >= total:
+                        return
+                    target = f"{path}{'&' if '?' in path else '?'}bench={n}" if cold else path
+                    started = time.perf_counter()
+                    try:
+                        connection.request('GET', target)
+                        response = connection.getresponse()
+                        response.read()
+                        ok = response.status == 200
+                    except (OSError, http.client.HTTPException):
+                        connection.close()
+                        ok = False
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        errors[0] += not ok
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(client)
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+
+        return {'rps': len(latencies) / wall if wall else 0, 'p50': percentile(0.50), 'p99': percentile(0.99), 'errors': errors[0]}
@@ -0,0 +1,83 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from books.benchmarks import BASELINE_PATH, LATENCY_TOLERANCE, compare, load_baseline, report, run_suite
+from books.models import Book
+from books.seeding import DEFAULT_SIZES, seed_library
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a synthetic library into a throwaway test database, measures queries and latency of every '
+        'endpoint and send_overdue_notices, and fails on regressions against the committed baseline'
+    )
+
+    def add_arguments(self, parser):
+        for name, size in DEFAULT_SIZES.items():
+            parser.add_argument(f'--{name}', type=int, default=size, help=f'Synthetic {name} to seed (default {size})')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic library')
+        parser.add_argument('--repeat', type=int, default=5, help='Measured requests per endpoint')
+        parser.add_argument('--output', help='Write the JSON report here ("-" for stdout)')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH), help='Baseline report to compare against')
+        parser.add_argument('--update-baseline', action='store_true', help='Write this run as the new baseline instead of comparing')
+        parser.add_argument('--tolerance', type=float, default=LATENCY_TOLERANCE, help='Allowed p50 latency factor over the baseline')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the seeded test database and reuse it next run')
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in DEFAULT_SIZES}
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        # Every request clears the response cache, so keep it away from any shared cache server
+        caches = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+        try:
+            with override_settings(CACHES=caches, CATALOG_CACHE='default'):
+                if options['keepdb'] and Book.objects.exists():
+                    self.stdout.write('Reusing the seeded test database.')
+                else:
+                    self.seed(sizes, options['seed'])
+                results = run_suite(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        current = report(results, sizes, options['seed'], options['repeat'])
+        if options['output'] == '-':
+            json.dump(current, sys.stdout, indent=2)
+            sys.stdout.write('\n')
+        elif options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(current, f, indent=2)
+
+        self.stdout.write(f"{'endpoint':<30} {'status':>6} {'queries':>7} {'p50 ms':>9} {'max ms':>9}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<30} {result['status'] or '-':>6} {result['queries']:>7} "
+                f"{result['p50_ms']:>9.1f} {result['max_ms']:>9.1f}"
+            )
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump(current, f, indent=2)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote baseline {options['baseline']}."))
+            return
+
+        baseline = load_baseline(options['baseline'])
+        if current['sizes'] != baseline['sizes'] or current['database'] != baseline['database']:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was taken at {baseline['sizes']} on {baseline['database']}; comparing query counts only."
+            ))
+        regressions = compare(current, baseline, tolerance=options['tolerance'])
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(regression))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def seed(self, sizes, seed):
+        tables = seed_library(**sizes, seed=seed)
+        rows = sum(rows for rows, _ in tables.values())
+        seconds = sum(seconds for _, seconds in tables.values())
+        self.stdout.write(f'Seeded {rows} rows in {seconds:.1f}s.')
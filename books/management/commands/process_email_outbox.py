@@ -0,0 +1,121 @@
+import datetime
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from books.models import OutboundEmail
+
+class Command(BaseCommand):
+    help = 'Delivers queued OutboundEmail rows over one persistent SMTP connection'
+
+    # A claimed row is hidden from other workers for this long; if the worker dies
+    # mid-batch the row simply becomes due again. The claim is renewed before each
+    # send, and one send is cut off by SEND_TIMEOUT well before the claim runs out.
+    CLAIM_SECONDS = 300
+    SEND_TIMEOUT = 60
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit (cron mode)')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--backoff', type=float, default=30.0, help='Base retry delay in seconds, doubled per attempt')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.connection = None
+        sent = failed = 0
+
+        try:
+            while True:
+                batch = self.claim_batch()
+                if batch:
+                    batch_sent, batch_failed = self.deliver(batch)
+                    sent += batch_sent
+                    failed += batch_failed
+                    continue
+                if options['once']:
+                    break
+                self.close_connection()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close_connection()
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} email(s), {failed} failed attempt(s).'))
+
+    def claim_batch(self):
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OutboundEmail.objects.select_for_update(skip_locked=True)
+                .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at')[:self.options['batch_size']]
+            )
+            if batch:
+                claimed_until = now + datetime.timedelta(seconds=self.CLAIM_SECONDS)
+                OutboundEmail.objects.filter(pk__in=[e.pk for e in batch]).update(next_attempt_at=claimed_until)
+                for email in batch:
+                    email.next_attempt_at = claimed_until
+        return batch
+
+    def renew_claim(self, email):
+        """Extend the claim on email before sending it; False if it lapsed and another worker took the row."""
+        claimed_until = timezone.now() + datetime.timedelta(seconds=self.CLAIM_SECONDS)
+        # next_attempt_at is still what this worker set unless someone else claimed (or sent) the row since
+        renewed = OutboundEmail.objects.filter(
+            pk=email.pk, status=OutboundEmail.PENDING, next_attempt_at=email.next_attempt_at
+        ).update(next_attempt_at=claimed_until)
+        email.next_attempt_at = claimed_until
+        return renewed == 1
+
+    def get_connection(self):
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False, timeout=self.SEND_TIMEOUT)
+            self.connection.open()
+        return self.connection
+
+    def close_connection(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def deliver(self, batch):
+        sent = failed = 0
+        for email in batch:
+            if not self.renew_claim(email):
+                continue
+            try:
+                self.get_connection().send_messages([email.to_message()])
+            except Exception as e:
+                # Drop the connection; the next message reconnects
+                self.close_connection()
+                self.record_failure(email, e)
+                failed += 1
+            else:
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status=OutboundEmail.SENT, sent_at=timezone.now(), attempts=email.attempts + 1, last_error=''
+                )
+                sent += 1
+        return sent, failed
+
+    def record_failure(self, email, error):
+        attempts = email.attempts + 1
+        if attempts >= self.options['max_attempts']:
+            status = OutboundEmail.FAILED
+            next_attempt_at = timezone.now()
+        else:
+            status = OutboundEmail.PENDING
+            delay = self.options['backoff'] * (2 ** (attempts - 1))
+            next_attempt_at = timezone.now() + datetime.timedelta(seconds=delay)
+
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=str(error)
+        )
+        self.stdout.write(self.style.ERROR(f"Failed to send to {email.to} (attempt {attempts}): {error}"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from books.models import Book
+
+class Command(BaseCommand):
+    help = 'Rebuilds the Book.active_loans counters from open Borrow rows'
+
+    def handle(self, *args, **kwargs):
+        drifted = Book.objects.reconcile_active_loans()
+
+        if drifted:
+            self.stdout.write(self.style.WARNING(f'Fixed active_loans on {drifted} book(s).'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All active_loans counters are in sync.'))
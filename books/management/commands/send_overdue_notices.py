@@ -1,44 +1,110 @@
+import time
+from itertools import groupby
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
-from books.models import Borrow
+from books.models import BackgroundJob, Borrow
 
 class Command(BaseCommand):
     help = 'Sends email reminders for overdue books'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Build the notices but do not send them')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many students')
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages sent per SMTP connection')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round-trip')
+        parser.add_argument('--job', type=int, default=None, help='BackgroundJob id to report progress to')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
         now = timezone.now()
-        # Find books that are NOT returned and due date is in the past
-        overdue_borrows = Borrow.objects.filter(returned=False, due_date__lt=now)
+        # Find books that are NOT returned and due date is in the past, grouped by student
+        overdue = Borrow.objects.filter(returned=False, due_date__lt=now)
+        progress = BackgroundJob.objects.filter(pk=options['job']) if options['job'] else None
+        if progress is not None:
+            total = overdue.exclude(borrower__email='').values('borrower').distinct().count()
+            if options['limit'] is not None:
+                total = min(total, options['limit'])
+            progress.update(total=total)
+
+        overdue_borrows = (
+            overdue
+            .select_related('borrower', 'borrowing')
+            .only('due_date', 'borrower__first', 'borrower__email', 'borrower__tup_id', 'borrowing__title')
+            .order_by('borrower_id', 'due_date')
+            .iterator(chunk_size=options['chunk_size'])
+        )
+
+        students = books = sent = failed = 0
+        batch = []
+
+        for _, borrows in groupby(overdue_borrows, key=lambda b: b.borrower_id):
+            if options['limit'] is not None and students >= options['limit']:
+                break
+            borrows = list(borrows)
+            students += 1
+            books += len(borrows)
 
-        count = 0
+            student = borrows[0].borrower
+            if not student.email:
+                continue
+            batch.append(self.build_notice(student, borrows))
 
-        if not overdue_borrows.exists():
+            if len(batch) >= options['batch_size']:
+                batch_sent, batch_failed = self.send_batch(batch, options['dry_run'])
+                sent += batch_sent
+                failed += batch_failed
+                batch = []
+                if progress is not None:
+                    progress.update(sent=sent, failed=failed)
+
+        if batch:
+            batch_sent, batch_failed = self.send_batch(batch, options['dry_run'])
+            sent += batch_sent
+            failed += batch_failed
+        if progress is not None:
+            progress.update(sent=sent, failed=failed)
+
+        if not students:
             self.stdout.write(self.style.WARNING('No overdue books found.'))
             return
 
-        for borrow in overdue_borrows:
-            student = borrow.borrower
-            if student.email:
-                try:
-                    send_mail(
-                        subject="URGENT: Overdue Library Book",
-                        message=f"""
-                        Dear {student.first},
-                        
-                        This is a reminder that the book '{borrow.borrowing.title}' was due on {borrow.due_date.date()}.
-                        
-                        Please return it to the library immediately to avoid penalties.
-                        
-                        Thank you.
-                        """,
-                        from_email=settings.EMAIL_HOST_USER,
-                        recipient_list=[student.email],
-                        fail_silently=False,
-                    )
-                    count += 1
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Failed to send to {student.tup_id}: {str(e)}"))
-        
-        self.stdout.write(self.style.SUCCESS(f'Successfully sent {count} overdue emails.'))
\ No newline at end of file
+        elapsed = time.monotonic() - started
+        rate = sent / elapsed if elapsed else 0
+        verb = 'Would send' if options['dry_run'] else 'Successfully sent'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {sent} overdue emails covering {books} books for {students} students '
+            f'({failed} failed) in {elapsed:.2f}s ({rate:.1f} emails/s).'
+        ))
+
+    def build_notice(self, student, borrows):
+        book_lines = "\n".join(
+            f"- '{borrow.borrowing.title}' was due on {borrow.due_date.date()}" for borrow in borrows
+        )
+        return EmailMessage(
+            subject="URGENT: Overdue Library Book",
+            body=(
+                f"Dear {student.first},\n\n"
+                f"This is a reminder that the following books are overdue:\n\n"
+                f"{book_lines}\n\n"
+                f"Please return them to the library immediately to avoid penalties.\n\n"
+                f"Thank you."
+            ),
+            from_email=settings.EMAIL_HOST_USER,
+            to=[student.email],
+        )
+
+    def send_batch(self, messages, dry_run):
+        if dry_run:
+            return len(messages), 0
+        try:
+            # One SMTP connection per batch instead of one per message
+            with get_connection(fail_silently=False) as connection:
+                sent = connection.send_messages(messages) or 0
+        except Exception as e:
+            recipients = ", ".join(message.to[0] for message in messages[:5])
+            self.stdout.write(self.style.ERROR(f"Failed to send batch of {len(messages)} ({recipients}, ...): {str(e)}"))
+            return 0, len(messages)
+        return sent, len(messages) - sent
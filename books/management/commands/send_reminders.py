@@ -0,0 +1,63 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from books.models import Borrow, OutboundEmail
+
+class Command(BaseCommand):
+    help = 'Queues return reminders for loans entering the reminder window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, one pass every --interval seconds')
+        parser.add_argument('--interval', type=float, default=300.0)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                queued = self.run_once(options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f'Queued {queued} reminder(s).'))
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def run_once(self, batch_size):
+        """One scheduler pass. Returns the number of reminders queued."""
+        queued = 0
+        while True:
+            batch = self.queue_batch(batch_size)
+            queued += batch
+            if batch < batch_size:
+                return queued
+
+    def queue_batch(self, batch_size):
+        now = timezone.now()
+        min_hours, max_hours = Borrow.REMINDER_WINDOW_HOURS
+        with transaction.atomic():
+            # Range scan on the partial reminder index: open loans without a reminder
+            # whose due date has just come within the window
+            borrows = list(
+                Borrow.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(
+                    returned=False,
+                    reminder_sent_at__isnull=True,
+                    due_date__gte=now + datetime.timedelta(hours=min_hours),
+                    due_date__lte=now + datetime.timedelta(hours=max_hours),
+                )
+                .select_related('borrower', 'borrowing')
+                .order_by('due_date')[:batch_size]
+            )
+            if not borrows:
+                return 0
+
+            # Hand off to the outbox worker, which batches delivery over one SMTP connection
+            OutboundEmail.enqueue_many(
+                (borrow.reminder_message((borrow.due_date - now).total_seconds() / 3600), borrow.reminder_key())
+                for borrow in borrows
+            )
+            Borrow.objects.filter(pk__in=[borrow.pk for borrow in borrows]).update(reminder_sent_at=now)
+        return len(borrows)
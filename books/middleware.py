@@ -0,0 +1,189 @@
+"""Opt-in per-request profiling (settings.REQUEST_PROFILING).
+
+When enabled, every request gets a Server-Timing header (total, db and
+serializer time, with the query count) and one JSON log line on the
+'books.middleware' logger. The log line also lists statements repeated
+REQUEST_PROFILING_DUPLICATES times or more under one SQL fingerprint,
+which is what an N+1 looks like. Requests to views in books/views.py
+slower than REQUEST_PROFILING_SLOW_MS are sampled (at
+REQUEST_PROFILING_SAMPLE_RATE) into a warning with their costliest
+queries.
+
+When disabled the middleware raises MiddlewareNotUsed, so Django drops it
+from the chain at startup and requests never touch this module.
+
+Queries are counted through a database execute wrapper and serializer
+time by timing BaseSerializer.data; both are installed the first time
+the middleware loads and only record while a request is being profiled.
+The profile lives in a context variable, so the async views' ORM calls
+(run on asgiref's worker thread) land on the right request.
+"""
+import contextvars
+import json
+import logging
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+TOP_QUERIES = 5
+
+_current = contextvars.ContextVar('request_profile', default=None)
+_IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """sql with literals and IN lists collapsed, so the same statement with other values groups together."""
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _LITERAL_RE.sub('?', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.view = None
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        # sql -> [count, seconds]; fingerprinted once, when the request is reported
+        self.statements = {}
+
+    def add_query(self, sql, seconds):
+        self.query_count += 1
+        self.db_time += seconds
+        entry = self.statements.setdefault(sql, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def by_fingerprint(self):
+        """[(fingerprint, count, seconds)], costliest first."""
+        grouped = {}
+        for sql, (count, seconds) in self.statements.items():
+            entry = grouped.setdefault(fingerprint(sql), [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+        return sorted(((sql, count, seconds) for sql, (count, seconds) in grouped.items()), key=lambda q: -q[2])
+
+    def server_timing(self):
+        return (
+            f'total;dur={self.duration * 1000:.1f}, '
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries", '
+            f'serializer;dur={self.serializer_time * 1000:.1f}'
+        )
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def _wrap_connection(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _timed(data):
+    def timed_data(serializer):
+        profile = _current.get()
+        if profile is None or profile.serializing:
+            # Nested serializers are already inside the outer one's time
+            return data(serializer)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return data(serializer)
+        finally:
+            profile.serializer_time += time.perf_counter() - started
+            profile.serializing = False
+    timed_data.profiled = True
+    return timed_data
+
+
+def install():
+    """Hook query and serializer timing in; idempotent."""
+    connection_created.connect(_wrap_connection, dispatch_uid='books.middleware')
+    if not getattr(BaseSerializer.data.fget, 'profiled', False):
+        BaseSerializer.data = property(_timed(BaseSerializer.data.fget))
+
+
+class RequestProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.duplicates = getattr(settings, 'REQUEST_PROFILING_DUPLICATES', 5)
+        self.slow_ms = getattr(settings, 'REQUEST_PROFILING_SLOW_MS', 500)
+        self.sample_rate = getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 1.0)
+        install()
+
+    def __call__(self, request):
+        # Connections opened before install() never sent connection_created to it
+        for connection in connections.all(initialized_only=True):
+            _wrap_connection(connection)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        profile.finish()
+
+        response['Server-Timing'] = profile.server_timing()
+        self.report(request, response, profile)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            view = getattr(view_func, 'view_class', view_func)
+            profile.view = f"{view.__module__}.{getattr(view, '__name__', type(view).__name__)}"
+
+    def report(self, request, response, profile):
+        queries = profile.by_fingerprint()
+        line = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "view": profile.view,
+            "duration_ms": round(profile.duration * 1000, 2),
+            "db_queries": profile.query_count,
+            "db_ms": round(profile.db_time * 1000, 2),
+            "serializer_ms": round(profile.serializer_time * 1000, 2),
+            "duplicates": [
+                {"sql": sql, "count": count} for sql, count, _ in queries if count >= self.duplicates
+            ],
+        }
+        logger.info(json.dumps(line), extra={"profile": line})
+
+        slow = line["duration_ms"] >= self.slow_ms
+        if slow and (profile.view or '').startswith('books.views.') and random.random() < self.sample_rate:
+            sample = {
+                **line,
+                "top_queries": [
+                    {"sql": sql, "count": count, "ms": round(seconds * 1000, 2)}
+                    for sql, count, seconds in queries[:TOP_QUERIES]
+                ],
+            }
+            logger.warning(json.dumps(sample), extra={"profile": sample})
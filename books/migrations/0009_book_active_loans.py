@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:17
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_active_loans(apps, schema_editor):
+    Book = apps.get_model('books', 'Book')
+    Borrow = apps.get_model('books', 'Borrow')
+    open_loans = Borrow.objects.filter(
+        borrowing=OuterRef('pk'), returned=False
+    ).order_by().values('borrowing').annotate(c=Count('pk')).values('c')
+    Book.objects.update(active_loans=Coalesce(Subquery(open_loans), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_book_quantity_alter_borrow_borrower_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='active_loans',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_active_loans, migrations.RunPython.noop),
+    ]
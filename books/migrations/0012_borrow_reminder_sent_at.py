@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrow',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('reminder_sent_at__isnull', True), ('returned', False)), fields=['due_date'], name='borrow_reminder_due_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:26
+
+import django.db.models.deletion
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_today(apps, schema_editor):
+    # Only today matters for the limit; earlier days are left empty
+    Borrow = apps.get_model('books', 'Borrow')
+    DailyBorrower = apps.get_model('books', 'DailyBorrower')
+    DailyBorrowStats = apps.get_model('books', 'DailyBorrowStats')
+
+    today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    student_ids = set(Borrow.objects.filter(
+        borrowed_date__gte=today_start,
+        borrowed_date__lt=today_start + datetime.timedelta(days=1),
+    ).values_list('borrower_id', flat=True))
+
+    day = today_start.date()
+    DailyBorrower.objects.bulk_create([DailyBorrower(day=day, student_id=pk) for pk in student_ids])
+    DailyBorrowStats.objects.create(day=day, borrower_count=len(student_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_borrow_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBorrowStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('borrower_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyBorrower',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='borrow_days', to='books.student')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'student'), name='daily_borrower_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_today, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:30
+
+import re
+
+from django.db import migrations, models
+
+FTS_TABLE = 'books_book_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX book_search_gin ON books_book USING gin ("
+            "(setweight(to_tsvector('simple', books_book.title), 'A') || "
+            "to_tsvector('simple', books_book.search_document)))"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, document, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    Book = apps.get_model('books', 'Book')
+    SearchTerm = apps.get_model('books', 'SearchTerm')
+    books = list(Book.objects.prefetch_related('author', 'subject'))
+    terms = set()
+    for book in books:
+        parts = [book.title, book.description]
+        parts += [author.name for author in book.author.all()]
+        parts += [subject.name for subject in book.subject.all()]
+        book.search_document = " ".join(part for part in parts if part)
+        terms.update(t.lower() for t in re.findall(r'\w+', book.search_document) if len(t) <= 64)
+    Book.objects.bulk_update(books, ['search_document'], batch_size=500)
+    SearchTerm.objects.bulk_create([SearchTerm(term=term) for term in terms], ignore_conflicts=True)
+
+    if vendor == 'sqlite' and books:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, document) VALUES (%s, %s, %s)",
+                [(book.pk, book.title, book.search_document) for book in books],
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS book_search_gin")
+    elif vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_daily_borrow_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
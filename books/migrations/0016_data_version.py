@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+def create_versions(apps, schema_editor):
+    DataVersion = apps.get_model('books', 'DataVersion')
+    DataVersion.objects.bulk_create([DataVersion(name='catalog', version=1), DataVersion(name='circulation', version=1)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0015_book_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
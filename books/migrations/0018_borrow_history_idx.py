@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0017_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['borrower', '-borrowed_date'], name='borrow_history_idx'),
+        ),
+    ]
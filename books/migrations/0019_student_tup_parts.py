@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:42
+
+import re
+
+from django.db import migrations, models
+
+
+def populate_tup_parts(apps, schema_editor):
+    # Same parsing as books.models.parse_tup_id, frozen here
+    Student = apps.get_model('books', 'Student')
+    students = []
+    for student in Student.objects.only('id', 'tup_id').iterator():
+        match = re.match(r'^TUPM-(\d{2})-(\d{4})$', student.tup_id, re.IGNORECASE)
+        if match:
+            student.tup_year, student.tup_serial = int(match.group(1)), int(match.group(2))
+            students.append(student)
+    Student.objects.bulk_update(students, ['tup_year', 'tup_serial'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_borrow_history_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='tup_serial',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='tup_year',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['tup_serial', 'tup_year'], name='student_tup_parts_idx'),
+        ),
+        migrations.RunPython(populate_tup_parts, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import BooleanField, Count, DateTimeField, DurationField, Exists, ExpressionWrapper, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, TruncDate
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 import datetime
-from django.core.mail import send_mail
+import re
+from django.core.mail import EmailMessage, send_mail
 from .email_templates import BORROW_CONFIRMATION, REMINDER, OVERDUE
+from .caching import invalidate_books
 
 # Create your models here.
 class Author(models.Model):
@@ -19,6 +23,66 @@ class Subject(models.Model):
         return self.name
 
 
+class BookQuerySet(models.QuerySet):
+    def with_availability(self):
+        """Catalog queryset: availability comes from the active_loans column, authors are prefetched."""
+        return self.prefetch_related('author')
+
+    def with_open_loans(self):
+        """Prefetch each book's open loans (and their borrowers) into book.open_loans."""
+        return self.prefetch_related(models.Prefetch(
+            'borrowing',
+            queryset=Borrow.objects.filter(returned=False).select_related('borrower').order_by('id'),
+            to_attr='open_loans',
+        ))
+
+    def filter_catalog(self, title=None, author=None, subject=None, available=False, year_min=None, year_max=None):
+        """Catalog search filters, all pushed down into SQL.
+
+        Author/subject use EXISTS subqueries so a book matching several names
+        is still returned once.
+        """
+        queryset = self
+        if title:
+            queryset = queryset.filter(title__icontains=title)
+        if author:
+            queryset = queryset.filter(Exists(Book.author.through.objects.filter(
+                book_id=OuterRef('pk'), author__name__icontains=author,
+            )))
+        if subject:
+            queryset = queryset.filter(Exists(Book.subject.through.objects.filter(
+                book_id=OuterRef('pk'), subject__name__icontains=subject,
+            )))
+        if available:
+            queryset = queryset.filter(active_loans__lt=F('quantity'))
+        if year_min is not None:
+            queryset = queryset.filter(publication_year__gte=year_min)
+        if year_max is not None:
+            queryset = queryset.filter(publication_year__lte=year_max)
+        return queryset
+
+    @staticmethod
+    def _counted_loans():
+        open_loans = Borrow.objects.filter(
+            borrowing=OuterRef('pk'), returned=False
+        ).order_by().values('borrowing').annotate(c=Count('pk')).values('c')
+        return Coalesce(Subquery(open_loans), 0)
+
+    def with_counted_loans(self):
+        """Annotate the real number of open Borrow rows as counted_loans."""
+        return self.annotate(counted_loans=self._counted_loans())
+
+    def reconcile_active_loans(self):
+        """Rebuild active_loans from Borrow rows. Returns the number of books that had drifted."""
+        with transaction.atomic():
+            drifted = list(self.with_counted_loans().exclude(active_loans=F('counted_loans')).values_list('pk', flat=True))
+            if drifted:
+                self.filter(pk__in=drifted).update(active_loans=self._counted_loans(), updated_at=timezone.now())
+                DataVersion.bump(DataVersion.CATALOG)
+                invalidate_books(drifted)
+        return len(drifted)
+
+
 class Book(models.Model):
     title = models.CharField(max_length=64)
     author = models.ManyToManyField(Author)
@@ -28,22 +92,225 @@ class Book(models.Model):
     cover_image = models.TextField(max_length=64, blank=True, null=True, help_text="file name in static/books/images/(bookcover.png/.jpeg)")
     cover_url = models.URLField(blank=True, null=True, help_text="Full url to book cover")
     quantity = models.PositiveIntegerField(default=1)
+    # Denormalized count of open Borrow rows, maintained by Borrow.save() and the post_delete handler.
+    # Rebuild with `manage.py reconcile_active_loans` if it ever drifts.
+    active_loans = models.PositiveIntegerField(default=0, editable=False)
+    # Title, description, author and subject names; kept in sync by signals.py for books/search.py
+    search_document = models.TextField(blank=True, editable=False)
+    # Drives the changes feed (books/changes.py); queryset.update() callers must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='book_updated_idx'),
+        ]
+
+    @property
+    def open_loan_count(self):
+        # Counted from the with_open_loans() prefetch when present, so counts and loan list agree
+        if hasattr(self, 'open_loans'):
+            return len(self.open_loans)
+        return self.active_loans
+
+    @property
+    def available_copies(self):
+        return max(0, self.quantity - self.open_loan_count)
+
+    @property
+    def is_available(self):
+        return self.open_loan_count < self.quantity
+
     def __str__(self):
         authors = ", ".join(author.name for author in self.author.all())
         subjects = ", ".join(subject.name for subject in self.subject.all())
         return f"{self.title} by {authors} ({self.publication_year}) ({subjects})"
 
+class SearchTerm(models.Model):
+    """Vocabulary of words in Book.search_document, used to correct typos in search queries."""
+    term = models.CharField(max_length=64, unique=True)
+
+    def __str__(self):
+        return self.term
+
+TUP_ID_RE = re.compile(r'^TUPM-(\d{2})-(\d{4})$', re.IGNORECASE)
+# What the desk and the index form accept in place of a full id: 25-0001 or 0001
+SHORT_TUP_ID_RE = re.compile(r'^(?:(\d{2})-)?(\d{4})$')
+
+
+def parse_tup_id(tup_id):
+    """(year, serial) of a TUPM-YY-NNNN id, or (None, None) if it has another shape."""
+    match = TUP_ID_RE.match(tup_id or '')
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+class StudentQuerySet(models.QuerySet):
+    def matching_tup_id(self, value):
+        """Students a full (TUPM-25-0001), year-qualified (25-0001) or bare (0001) TUP ID refers to.
+
+        Every form is an index seek: the full id on the unique tup_id, the
+        shorter ones on (tup_serial, tup_year).
+        """
+        value = (value or '').strip()
+        match = SHORT_TUP_ID_RE.match(value)
+        if not match:
+            return self.filter(tup_id=value)
+        year, serial = match.groups()
+        if year is None:
+            return self.filter(tup_serial=int(serial))
+        return self.filter(tup_year=int(year), tup_serial=int(serial))
+
+    def resolve(self, value):
+        """The one student value refers to.
+
+        Raises Student.DoesNotExist, or Student.MultipleObjectsReturned naming
+        the candidates when a short form matches several students.
+        """
+        return self._resolved(value, list(self.matching_tup_id(value).order_by('tup_id')[:10]))
+
+    async def aresolve(self, value):
+        return self._resolved(value, [s async for s in self.matching_tup_id(value).order_by('tup_id')[:10]])
+
+    def _resolved(self, value, matches):
+        if not matches:
+            raise self.model.DoesNotExist(f"No student with TUP ID {value}")
+        if len(matches) > 1:
+            error = self.model.MultipleObjectsReturned(
+                f"TUP ID {value} matches several students: " + ", ".join(s.tup_id for s in matches)
+            )
+            error.matches = matches
+            raise error
+        return matches[0]
+
+
 class Student(models.Model):
     first = models.CharField(max_length=64)
     last = models.CharField(max_length=64)
     tup_id = models.CharField(max_length=64, unique=True)
     email = models.EmailField(unique=True)
+    # Parsed from tup_id on save so the short forms resolve by index (see StudentQuerySet.matching_tup_id)
+    tup_year = models.PositiveSmallIntegerField(null=True, editable=False)
+    tup_serial = models.PositiveIntegerField(null=True, editable=False)
+
+    objects = StudentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tup_serial', 'tup_year'], name='student_tup_parts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first} {self.last} ({self.tup_id})"
 
+    def save(self, *args, **kwargs):
+        self.tup_year, self.tup_serial = parse_tup_id(self.tup_id)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'tup_id' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'tup_year', 'tup_serial'}
+        super().save(*args, **kwargs)
+
+class DailyBorrowStats(models.Model):
+    """Distinct students who borrowed on a given local (TIME_ZONE) day.
+
+    Updated in the borrow transaction, so the daily limit is an O(1) lookup
+    instead of a COUNT(DISTINCT) over the day's Borrow rows.
+    """
+    day = models.DateField(unique=True)
+    borrower_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.borrower_count} students"
+
+
+class DailyBorrower(models.Model):
+    """One row per student per day; its unique constraint makes counting a student twice impossible."""
+    day = models.DateField()
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="borrow_days")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'student'], name='daily_borrower_unique'),
+        ]
+
+
+class DataVersion(models.Model):
+    """Monotonic change counter per data set, served as a strong ETag.
+
+    'catalog' covers everything the book listing shows (books, authors,
+    subjects, availability); 'circulation' covers the admin dashboard (open
+    loans, borrower names, book titles); 'book:<pk>' covers one book's
+    details and keys the response cache (books/caching.py). bump() waits
+    for the writer's transaction to commit and then runs as its own short
+    autocommit UPDATE: every write transaction touches these few rows, so
+    holding their lock until commit would serialize all checkouts behind
+    one another. A reader between the commit and the bump sees the new data
+    under the old version, which only costs it one more full response after
+    the bump.
+    """
+    CATALOG = 'catalog'
+    CIRCULATION = 'circulation'
+
+    name = models.CharField(max_length=32, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+    @classmethod
+    def bump(cls, *names):
+        transaction.on_commit(lambda: cls._increment(names))
+
+    @classmethod
+    def _increment(cls, names):
+        updated = cls.objects.filter(name__in=names).update(version=F('version') + 1)
+        if updated < len(names):
+            # A book's row starts with its first write (the named sets come from migration 0016);
+            # create the missing ones at 0 and count again, so a racing first write is not lost
+            cls.objects.bulk_create([cls(name=name) for name in names], ignore_conflicts=True)
+            cls.objects.filter(name__in=names).update(version=F('version') + 1)
+
+    @classmethod
+    def current(cls, *names):
+        """{name: version} in one indexed lookup; unknown names read as 0."""
+        versions = dict(cls.objects.filter(name__in=names).values_list('name', 'version'))
+        return {name: versions.get(name, 0) for name in names}
+
+
+class BorrowQuerySet(models.QuerySet):
+    def dashboard_rows(self, now):
+        """Open loans as flat dicts for the admin dashboard, one joined query.
+
+        The overdue flag, time left and display fields are computed in SQL so
+        no model instances or related objects are built per row. Loans without
+        a due date have nothing to count down to and are left out.
+        """
+        return self.filter(returned=False, due_date__isnull=False).annotate(
+            student_name=Concat(F('borrower__first'), Value(' '), F('borrower__last')),
+            student_id=F('borrower__tup_id'),
+            book_title=F('borrowing__title'),
+            due_day=TruncDate('due_date', tzinfo=datetime.timezone.utc),
+            is_overdue=ExpressionWrapper(Q(due_date__lt=now), output_field=BooleanField()),
+            time_left=ExpressionWrapper(F('due_date') - Value(now, output_field=DateTimeField()), output_field=DurationField()),
+        ).order_by('due_date', 'id').values(
+            'id', 'due_date', 'student_name', 'student_id', 'book_title', 'due_day', 'is_overdue', 'time_left',
+        )
+
+    def history(self, student):
+        """student's loans newest first, joined to the book title only (range scan on borrow_history_idx)."""
+        return self.filter(borrower=student).select_related('borrowing').only(
+            'borrowing__title', 'borrowed_date', 'due_date', 'returned',
+        ).order_by('-borrowed_date', '-id')
+
+
 class Borrow(models.Model):
     DAILY_LIMIT = 100
+    MAX_ACTIVE_LOANS = 3
+    # Reminders go out once a loan is between 3 and 6 hours from its due date
+    REMINDER_WINDOW_HOURS = (3, 6)
+    FROM_EMAIL = "TUP Student Library <adamconcepcion25@gmail.com>"
 
     borrowing = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="borrowing")
     borrower = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="borrower")
@@ -51,29 +318,86 @@ class Borrow(models.Model):
     due_date = models.DateTimeField(null=True, blank=True)
     duration_hours = models.IntegerField(default=24)
     returned = models.BooleanField(default=False)
-    
-    @staticmethod
-    def get_today_borrow_count():
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_end = today_start + datetime.timedelta(days=1)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True)
+    # Drives the changes feed (books/changes.py); bulk_update() callers must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = BorrowQuerySet.as_manager()
 
-        count = Borrow.objects.filter(
-            borrowed_date__gte = today_start,
-            borrowed_date__lt = today_end
-        ).values('borrower').distinct().count()
+    class Meta:
+        indexes = [
+            # Partial indexes over open loans only: returned rows pile up forever but the
+            # hot paths (availability, circulation, dashboards) only ever ask about open ones
+            models.Index(fields=['borrowing'], name='borrow_open_book_idx', condition=models.Q(returned=False)),
+            models.Index(fields=['borrower', 'borrowing'], name='borrow_open_borrower_idx', condition=models.Q(returned=False)),
+            models.Index(fields=['due_date'], name='borrow_open_due_idx', condition=models.Q(returned=False)),
+            # Daily limit: range on borrowed_date, distinct borrower read from the index
+            models.Index(fields=['borrowed_date', 'borrower'], name='borrow_date_borrower_idx'),
+            # Only open loans still waiting for a reminder, so each scheduler tick is a short range scan
+            models.Index(
+                fields=['due_date'],
+                name='borrow_reminder_due_idx',
+                condition=models.Q(returned=False, reminder_sent_at__isnull=True),
+            ),
+            # Keyset scans for the changes feed
+            models.Index(fields=['updated_at', 'id'], name='borrow_updated_idx'),
+            # One student's history, newest first
+            models.Index(fields=['borrower', '-borrowed_date'], name='borrow_history_idx'),
+        ]
 
-        return count
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which copy this row held when loaded so save() and the post_delete
+        # handler in signals.py can adjust Book.active_loans
+        if 'returned' in field_names and 'borrowing_id' in field_names:
+            instance._held_book_id = instance.borrowing_id if not instance.returned else None
+        return instance
+
+    def get_held_book_id(self):
+        """The book whose copy this row currently holds in the database, or None."""
+        if not hasattr(self, '_held_book_id'):
+            # New rows hold nothing; rows loaded with deferred fields are looked up
+            row = Borrow.objects.filter(pk=self.pk).values_list('borrowing_id', 'returned').first() if self.pk else None
+            self._held_book_id = row[0] if row and not row[1] else None
+        return self._held_book_id
+
+    @staticmethod
+    def get_today_borrow_count():
+        count = DailyBorrowStats.objects.filter(day=timezone.localdate()).values_list('borrower_count', flat=True).first()
+        return count or 0
     
     @staticmethod
     def get_daily_limit_remaining():
         return Borrow.DAILY_LIMIT - Borrow.get_today_borrow_count()
+
+    @staticmethod
+    def register_daily_borrower(student_id, day=None):
+        """Count student towards day's limit (once per day). Must run inside the borrow transaction.
+
+        The slot is claimed with a conditional UPDATE, so concurrent checkouts can
+        never push the day past DAILY_LIMIT.
+        """
+        day = day or timezone.localdate()
+        _, created = DailyBorrower.objects.get_or_create(day=day, student_id=student_id)
+        if not created:
+            return
+        DailyBorrowStats.objects.get_or_create(day=day)
+        claimed = DailyBorrowStats.objects.filter(
+            day=day, borrower_count__lt=Borrow.DAILY_LIMIT
+        ).update(borrower_count=F('borrower_count') + 1)
+        if not claimed:
+            raise ValidationError(Borrow.daily_limit_message())
     
     def clean(self):
         if self.pk is None:
 
             current_active_loans=Borrow.objects.filter(borrower=self.borrower, returned=False).count()
-            if current_active_loans >= 3:
-                raise ValidationError(f"{self.borrower.first} has already borrowed the limit of 3 books.")
+            if current_active_loans >= Borrow.MAX_ACTIVE_LOANS:
+                raise ValidationError(self.loan_limit_message(self.borrower))
+
+            if not self.borrowing.is_available:
+                raise ValidationError(f"All copies of {self.borrowing.title} are currently borrowed.", code='unavailable')
             
             # today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
             # today_end = today_start + datetime.timedelta(days=1)
@@ -87,56 +411,122 @@ class Borrow(models.Model):
             # if already_borrowed_today:
             #     raise ValidationError(f"{self.borrower.first} has already borrowed a book today. Only 1 book per student per day allowed.")
             
-            if Borrow.get_today_borrow_count() >= Borrow.DAILY_LIMIT:
-                raise ValidationError(
-                    f"Daily borrowing limit ({Borrow.DAILY_LIMIT} students) has been reached. "
-                    f"Please try again tomorrow."
-                )
+            today = timezone.localdate()
+            if (
+                Borrow.get_today_borrow_count() >= Borrow.DAILY_LIMIT
+                and not DailyBorrower.objects.filter(day=today, student=self.borrower).exists()
+            ):
+                raise ValidationError(Borrow.daily_limit_message())
 
-    def save(self, *args, **kwargs):
-        is_new = self.pk is None
+    @staticmethod
+    def loan_limit_message(student):
+        return f"{student.first} has already borrowed the limit of {Borrow.MAX_ACTIVE_LOANS} books."
 
+    @staticmethod
+    def daily_limit_message():
+        return (
+            f"Daily borrowing limit ({Borrow.DAILY_LIMIT} students) has been reached. "
+            f"Please try again tomorrow."
+        )
+
+    def set_default_due_date(self):
         if not self.due_date:
             start_time = self.borrowed_date if self.borrowed_date else timezone.now()
             self.due_date = start_time + datetime.timedelta(hours=max(self.duration_hours, 1))
-        super().save(*args, **kwargs)
 
-        if is_new:
-            self.send_borrow_confirmation()
+    def save(self, *args, **kwargs):
+        is_new = self.pk is None
+        self.set_default_due_date()
+
+        with transaction.atomic():
+            if is_new:
+                Borrow.register_daily_borrower(self.borrower_id, timezone.localdate(self.borrowed_date))
+            held_book_id = self._update_active_loans()
+            super().save(*args, **kwargs)
+            if is_new:
+                # Queued in the same transaction; process_email_outbox does the SMTP work
+                self.queue_borrow_confirmation()
+        self._held_book_id = held_book_id
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            # Release the copy the row holds now, not the one a stale instance held when loaded
+            row = Borrow.objects.select_for_update().filter(pk=self.pk).values_list('borrowing_id', 'returned').first()
+            self._held_book_id = row[0] if row and not row[1] else None
+            return super().delete(*args, **kwargs)
+
+    def _update_active_loans(self):
+        """Move this row's claim on Book.active_loans to match its current state.
+
+        Claiming a copy is a conditional UPDATE, so the counter is also the guard
+        that stops two checkouts from taking the last copy.
+        """
+        held_book_id = self.get_held_book_id()
+        wanted_book_id = self.borrowing_id if not self.returned else None
+        if held_book_id == wanted_book_id:
+            return wanted_book_id
+
+        if held_book_id is not None:
+            Book.objects.filter(pk=held_book_id, active_loans__gt=0).update(
+                active_loans=F('active_loans') - 1, updated_at=timezone.now()
+            )
+        if wanted_book_id is not None:
+            claimed = Book.objects.filter(
+                pk=wanted_book_id, active_loans__lt=F('quantity')
+            ).update(active_loans=F('active_loans') + 1, updated_at=timezone.now())
+            if not claimed:
+                raise ValidationError(f"All copies of {self.borrowing.title} are currently borrowed.", code='unavailable')
+        return wanted_book_id
     
-    def send_borrow_confirmation(self):
+    def borrow_confirmation_message(self):
         message = BORROW_CONFIRMATION.format(
             first_name = self.borrower.first,
             book_title = self.borrowing.title,
             due_date = self.due_date.strftime('%B %d, %Y at %I:%M %p'),
             duration = self.duration_hours,
         )
-        send_mail(
+        return EmailMessage(
             subject = f"You borrowed: {self.borrowing.title}",
-            message = message.strip(),
-            from_email = "TUP Student Library <adamconcepcion25@gmail.com>",
-            recipient_list = [self.borrower.email],
-            fail_silently = False,
+            body = message.strip(),
+            from_email = Borrow.FROM_EMAIL,
+            to = [self.borrower.email],
         )
 
+    def borrow_confirmation_key(self):
+        return f"borrow-confirmation:{self.pk}"
+
+    def queue_borrow_confirmation(self):
+        OutboundEmail.enqueue(self.borrow_confirmation_message(), self.borrow_confirmation_key())
+
+    def send_borrow_confirmation(self):
+        self.borrow_confirmation_message().send(fail_silently=False)
+
+    def reminder_message(self, hours_left):
+        message = REMINDER.format(
+            first_name = self.borrower.first,
+            book_title = self.borrowing.title,
+            hours_left = f"{hours_left:.1f}",
+            due_date = self.due_date.strftime('%B %d, %Y at %I:%M %p'),
+        )
+        return EmailMessage(
+            subject = "Reminder to Return Book Soon!",
+            body = message.strip(),
+            from_email = Borrow.FROM_EMAIL,
+            to = [self.borrower.email],
+        )
+
+    def reminder_key(self):
+        return f"reminder:{self.pk}"
+
     def send_reminder(self):
-        if self.returned:
+        if self.returned or self.reminder_sent_at:
             return
         hours_left = (self.due_date - timezone.now()).total_seconds() / 3600
-        if 3<= hours_left <= 6:
-            message = REMINDER.format(
-                first_name = self.borrower.first,
-                book_title = self.borrowing.title,
-                hours_left = f"{hours_left:.1f}",
-                due_date = self.due_date.strftime('%B %d, %Y at %I:%M %p'),
-            )
-            send_mail(
-                subject = "Reminder to Return Book Soon!",
-                message = message.strip(),
-                from_email = "TUP Student Library <adamconcepcion25@gmail.com>",
-                recipient_list = [self.borrower.email],
-                fail_silently=False,
-            )
+        min_hours, max_hours = Borrow.REMINDER_WINDOW_HOURS
+        if min_hours <= hours_left <= max_hours:
+            self.reminder_message(hours_left).send(fail_silently=False)
+            self.reminder_sent_at = timezone.now()
+            Borrow.objects.filter(pk=self.pk).update(reminder_sent_at=self.reminder_sent_at)
 
     def send_overdue_notice(self):
         if self.returned or self.due_date > timezone.now():
@@ -150,10 +540,105 @@ class Borrow(models.Model):
         send_mail(
             subject = "Overdue Notice.",
             message = message.strip(),
-            from_email = "TUP Student Library <adamconcepcion25@gmail.com>",
+            from_email = Borrow.FROM_EMAIL,
             recipient_list = [self.borrower.email],
             fail_silently=False,
             )
 
     def __str__(self):
-        return f"{self.borrowing} is borrowed by {self.borrower.first} {self.borrower.last} ({self.borrower.tup_id})"
\ No newline at end of file
+        return f"{self.borrowing} is borrowed by {self.borrower.first} {self.borrower.last} ({self.borrower.tup_id})"
+
+
+class OutboundEmail(models.Model):
+    """Outbox row for an email the request path wants sent.
+
+    Rows are written in the caller's transaction and delivered by the
+    process_email_outbox worker, so checkout never waits on SMTP.
+    dedupe_key is unique: queueing the same notice twice is a no-op.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    dedupe_key = models.CharField(max_length=128, unique=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.EmailField()
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    @classmethod
+    def from_message(cls, message, dedupe_key):
+        return cls(
+            dedupe_key=dedupe_key,
+            subject=message.subject,
+            body=message.body,
+            from_email=message.from_email,
+            to=message.to[0],
+        )
+
+    @classmethod
+    def enqueue(cls, message, dedupe_key):
+        cls.enqueue_many([(message, dedupe_key)])
+
+    @classmethod
+    def enqueue_many(cls, keyed_messages):
+        """Queue [(EmailMessage, dedupe_key), ...] with one INSERT, skipping keys already queued."""
+        # [''] is what a student without an email address produces
+        rows = [cls.from_message(message, key) for message, key in keyed_messages if message.to and message.to[0]]
+        if rows:
+            cls.objects.bulk_create(rows, ignore_conflicts=True)
+
+    def to_message(self, connection=None):
+        return EmailMessage(
+            subject=self.subject,
+            body=self.body,
+            from_email=self.from_email,
+            to=[self.to],
+            connection=connection,
+        )
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+
+class BackgroundJob(models.Model):
+    """Persisted status of work run off the request thread (see books/jobs.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=64)
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=QUEUED)
+    total = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'status'], name='job_kind_status_idx'),
+        ]
+
+    @property
+    def remaining(self):
+        return max(0, self.total - self.sent - self.failed)
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
\ No newline at end of file
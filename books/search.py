@@ -0,0 +1,158 @@
+"""Ranked full-text catalog search.
+
+Each book carries a search_document (title, description, author and
+subject names) maintained by signals.py. On PostgreSQL it is matched with
+to_tsvector/to_tsquery against a GIN expression index; on SQLite it is
+mirrored into the FTS5 table books_book_fts; title matches rank higher on
+both. Other backends fall back to icontains. Every query term is prefix-matched for search-as-you-type, and
+when nothing matches, misspelled terms are swapped for their closest
+words in the SearchTerm vocabulary.
+"""
+import difflib
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Book, SearchTerm
+
+FTS_TABLE = 'books_book_fts'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 8
+TITLE_WEIGHT = 10.0
+SEARCH_VECTOR_SQL = (
+    "(setweight(to_tsvector('simple', books_book.title), 'A') || "
+    "to_tsvector('simple', books_book.search_document))"
+)
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+def build_document(book):
+    """Text indexed for book; expects author/subject to be prefetched."""
+    parts = [book.title, book.description]
+    parts += [author.name for author in book.author.all()]
+    parts += [subject.name for subject in book.subject.all()]
+    return " ".join(part for part in parts if part)
+
+
+def refresh_search_documents(book_ids):
+    """Rebuild search_document (and the SQLite FTS rows) for the given books."""
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+    books = list(Book.objects.filter(pk__in=book_ids).only('id', 'title', 'description').prefetch_related('author', 'subject'))
+    for book in books:
+        book.search_document = build_document(book)
+    Book.objects.bulk_update(books, ['search_document'])
+    index_documents([(book.pk, book.title, book.search_document) for book in books], replace=book_ids)
+
+
+def index_documents(rows, replace=()):
+    """Add (book_id, title, search_document) rows to the vocabulary and, on SQLite, the FTS table.
+
+    FTS rows of the book ids in replace are dropped first; bulk loaders of
+    brand-new books leave it empty.
+    """
+    terms = {token for _, _, document in rows for token in tokenize(document) if len(token) <= 64}
+    SearchTerm.objects.bulk_create([SearchTerm(term=term) for term in terms], ignore_conflicts=True)
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            if replace:
+                placeholders = ", ".join(["%s"] * len(replace))
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", list(replace))
+            cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, title, document) VALUES (%s, %s, %s)", rows)
+
+
+def remove_search_document(book_id):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def correct_terms(terms):
+    """Replace each term with no vocabulary word starting with it by its closest known words.
+
+    Returns a list of alternatives per term; candidates come from an indexed
+    range scan over words that share the term's first letter.
+    """
+    corrected = []
+    for term in terms:
+        if SearchTerm.objects.filter(term__gte=term, term__lt=term + '￿').exists():
+            corrected.append([term])
+            continue
+        candidates = SearchTerm.objects.filter(
+            term__gte=term[0], term__lt=chr(ord(term[0]) + 1)
+        ).values_list('term', flat=True)[:5000]
+        matches = difflib.get_close_matches(term, list(candidates), n=3, cutoff=0.7)
+        corrected.append(matches or [term])
+    return corrected
+
+
+def _ranked_ids(alternatives, offset, limit):
+    """(page of book ids best match first, total matches) for books matching every term.
+
+    Each term matches any of its alternatives as a prefix.
+    """
+    if connection.vendor == 'sqlite':
+        match = " AND ".join(
+            "(" + " OR ".join(f'"{alt}"*' for alt in alts) + ")" for alts in alternatives
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+            total = cursor.fetchone()[0]
+            # bm25() is lower-is-better; title hits weigh 10x
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}, 1.0), rowid LIMIT %s OFFSET %s",
+                [match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()], total
+
+    if connection.vendor == 'postgresql':
+        tsquery = " & ".join(
+            "(" + " | ".join(f"{alt}:*" for alt in alts) + ")" for alts in alternatives
+        )
+        # Same expression as the GIN index created in migration 0015; titles carry weight A
+        vector = SEARCH_VECTOR_SQL
+        queryset = Book.objects.filter(
+            RawSQL(f"{vector} @@ to_tsquery('simple', %s)", [tsquery], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f"ts_rank({vector}, to_tsquery('simple', %s))", [tsquery], output_field=FloatField())
+        ).order_by('-rank', 'id')
+    else:
+        condition = Q()
+        for alts in alternatives:
+            any_alt = Q()
+            for alt in alts:
+                any_alt |= Q(search_document__icontains=alt)
+            condition &= any_alt
+        queryset = Book.objects.filter(condition).order_by('id')
+
+    return list(queryset.values_list('id', flat=True)[offset:offset + limit]), queryset.count()
+
+
+def search_books(query, offset=0, limit=20):
+    """Ranked page of books for query.
+
+    Returns (books, total, corrected_query); corrected_query is None unless
+    typo correction was needed to find anything.
+    """
+    terms = tokenize(query)[:MAX_TERMS]
+    if not terms:
+        return [], 0, None
+
+    page_ids, total = _ranked_ids([[term] for term in terms], offset, limit)
+    corrected_query = None
+    if not total:
+        alternatives = correct_terms(terms)
+        if any(alts != [term] for alts, term in zip(alternatives, terms)):
+            page_ids, total = _ranked_ids(alternatives, offset, limit)
+            corrected_query = " ".join(alts[0] for alts in alternatives)
+
+    books = Book.objects.with_availability().in_bulk(page_ids)
+    return [books[pk] for pk in page_ids if pk in books], total, corrected_query
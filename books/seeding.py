@@ -0,0 +1,336 @@
+"""Synthetic library data for benchmarks and local load testing.
+
+seed_library() bulk-inserts authors, subjects, books with their author and
+subject links, students and historical loans, generated batch_size rows
+at a time and written in one transaction. Nothing goes through
+Model.save() or the signals, so no confirmation emails are queued; the
+columns and tables those paths maintain (Book.active_loans,
+search_document and the search index, DailyBorrower/DailyBorrowStats,
+updated_at) are filled in here instead.
+
+Loans come in desk visits of one to three books, spread so that no day
+goes over Borrow.DAILY_LIMIT students. Open loans date from the last few
+weeks (most of them overdue) and respect the per-student and per-book
+limits; today is left empty so live checkouts still have the whole daily
+limit. Everything is drawn from one random.Random(seed): a seed always
+produces the same library.
+"""
+import datetime
+import math
+import random
+import time
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import DateField, DateTimeField, F
+from django.utils import timezone
+
+from .models import Author, Book, Borrow, DailyBorrower, DailyBorrowStats, DataVersion, Student, Subject, parse_tup_id
+from .search import index_documents
+
+DEFAULT_SIZES = {
+    'authors': 5000,
+    'subjects': 200,
+    'books': 50000,
+    'students': 20000,
+    'borrows': 500000,
+}
+# Share of borrows still out
+OPEN_RATIO = 0.01
+# Visits per day, kept under Borrow.DAILY_LIMIT distinct students
+VISITS_PER_DAY = 80
+LOAN_HOURS = (24, 24, 48, 72, 168)
+LOAN_FIELDS = [
+    'borrowing', 'borrower', 'borrowed_date', 'due_date', 'duration_hours', 'returned', 'reminder_sent_at', 'updated_at',
+]
+TUP_YEARS = range(18, 26)
+
+FIRST_NAMES = [
+    "Adrian", "Bea", "Carlo", "Dana", "Elijah", "Faith", "Gabriel", "Hannah", "Isaac", "Jasmine",
+    "Kevin", "Lea", "Miguel", "Nina", "Oscar", "Patricia", "Quinn", "Rafael", "Sofia", "Tomas",
+    "Ursula", "Vince", "Wendy", "Xavier", "Yana", "Zed",
+]
+LAST_NAMES = [
+    "Aquino", "Bautista", "Cruz", "Dela Cruz", "Espinosa", "Flores", "Garcia", "Hernandez", "Ignacio",
+    "Jimenez", "Lopez", "Mendoza", "Navarro", "Ocampo", "Pascual", "Quiambao", "Reyes", "Santos",
+    "Torres", "Uy", "Villanueva", "Yap", "Zamora",
+]
+TITLE_WORDS = [
+    "applied", "advanced", "algorithms", "analysis", "basic", "circuits", "control", "data", "design",
+    "digital", "discrete", "dynamics", "electrical", "engineering", "fluid", "foundations", "history",
+    "industrial", "introduction", "machine", "manufacturing", "materials", "mathematics", "mechanics",
+    "methods", "modern", "networks", "physics", "practical", "principles", "programming", "structures",
+    "systems", "theory", "thermodynamics", "welding",
+]
+SUBJECT_WORDS = [
+    "Architecture", "Chemistry", "Civil Engineering", "Computer Science", "Drafting", "Economics",
+    "Electronics", "English", "Filipino", "Fine Arts", "Hospitality", "Information Technology",
+    "Literature", "Mathematics", "Mechanical Engineering", "Physics", "Statistics",
+]
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _Timer:
+    """Rows written and seconds spent per table, for the throughput report."""
+
+    def __init__(self):
+        self.tables = {}
+
+    def insert(self, model, objects):
+        started = time.perf_counter()
+        created = model.objects.bulk_create(objects)
+        self.add(model._meta.label, len(objects), time.perf_counter() - started)
+        return created
+
+    def insert_rows(self, model, fields, rows):
+        """INSERT value tuples for fields as multi-row statements; no pks come back.
+
+        For the big tables: bulk_create() compiles every value of every row
+        into SQL and spends several times longer on that than the database
+        spends on the inserts.
+        """
+        if not rows:
+            return
+        started = time.perf_counter()
+        meta, ops, quote = model._meta, connection.ops, connection.ops.quote_name
+        columns = [meta.get_field(name) for name in fields]
+        adapters = [
+            ops.adapt_datetimefield_value if isinstance(field, DateTimeField)
+            else ops.adapt_datefield_value if isinstance(field, DateField)
+            else None
+            for field in columns
+        ]
+        placeholder = "(%s)" % ", ".join(["%s"] * len(columns))
+        per_statement = min(1000, (connection.features.max_query_params or 1000 * len(columns)) // len(columns))
+        with connection.cursor() as cursor:
+            for statement_rows in _batches(rows, per_statement):
+                params = [
+                    adapt(value) if adapt and value is not None else value
+                    for row in statement_rows for adapt, value in zip(adapters, row)
+                ]
+                cursor.execute("INSERT INTO %s (%s) VALUES %s" % (
+                    quote(meta.db_table), ", ".join(quote(field.column) for field in columns),
+                    ", ".join([placeholder] * len(statement_rows)),
+                ), params)
+        self.add(meta.label, len(rows), time.perf_counter() - started)
+
+    def add(self, label, rows, seconds):
+        total_rows, total_seconds = self.tables.get(label, (0, 0.0))
+        self.tables[label] = (total_rows + rows, total_seconds + seconds)
+
+
+def seed_library(authors=None, subjects=None, books=None, students=None, borrows=None, seed=0, batch_size=5000):
+    """Bulk-insert a synthetic library (sizes default to DEFAULT_SIZES).
+
+    Students' TUP IDs are numbered from TUPM-18-0001, so seed into a
+    database without synthetic students. Returns {table label: (rows,
+    seconds)} in insertion order.
+    """
+    sizes = {
+        'authors': authors, 'subjects': subjects, 'books': books, 'students': students, 'borrows': borrows,
+    }
+    sizes = {name: DEFAULT_SIZES[name] if size is None else size for name, size in sizes.items()}
+    if sizes['students'] > len(TUP_YEARS) * 9999:
+        raise ValueError(f"At most {len(TUP_YEARS) * 9999} students fit the TUPM-YY-NNNN id space")
+    if sizes['borrows'] and not (sizes['books'] and sizes['students']):
+        raise ValueError("Borrows need at least one book and one student")
+
+    rng = random.Random(seed)
+    timer = _Timer()
+    with transaction.atomic():
+        author_names = _seed_named(timer, Author, _author_names(rng, sizes['authors']), batch_size)
+        subject_names = _seed_named(timer, Subject, _subject_names(sizes['subjects']), batch_size)
+        quantities = _seed_books(timer, rng, sizes['books'], author_names, subject_names, batch_size)
+        student_ids = _seed_students(timer, rng, sizes['students'], batch_size)
+        _seed_borrows(timer, rng, sizes['borrows'], quantities, student_ids, batch_size)
+        if quantities:
+            # auto_now stamped them with the seeding time too; catalogued a day ago reads truer
+            Book.objects.filter(pk__gte=min(quantities), pk__lte=max(quantities)).update(
+                updated_at=timezone.now() - datetime.timedelta(days=1)
+            )
+
+        # The seeded books are all new, so none of their details can be cached yet
+        DataVersion.bump(DataVersion.CATALOG, DataVersion.CIRCULATION)
+    return timer.tables
+
+
+def _author_names(rng, count):
+    return (f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(count))
+
+
+def _subject_names(count):
+    for i in range(count):
+        name = SUBJECT_WORDS[i % len(SUBJECT_WORDS)]
+        yield name if i < len(SUBJECT_WORDS) else f"{name} {i // len(SUBJECT_WORDS) + 1}"
+
+
+def _seed_named(timer, model, names, batch_size):
+    """{pk: name} of the inserted Author or Subject rows."""
+    created = {}
+    for batch in _batches((model(name=name) for name in names), batch_size):
+        created.update((obj.pk, obj.name) for obj in timer.insert(model, batch))
+    return created
+
+
+def _seed_books(timer, rng, count, author_names, subject_names, batch_size):
+    """Insert books, their M2M links and search index rows; returns {book pk: quantity}."""
+    author_ids, subject_ids = list(author_names), list(subject_names)
+    AuthorLink, SubjectLink = Book.author.through, Book.subject.through
+    quantities = {}
+    for batch in _batches(range(count), batch_size):
+        rows = []
+        for _ in batch:
+            title = " ".join(rng.sample(TITLE_WORDS, rng.randint(2, 4))).title()
+            book_authors = rng.sample(author_ids, min(len(author_ids), rng.randint(1, 2)))
+            book_subjects = rng.sample(subject_ids, min(len(subject_ids), rng.randint(1, 3)))
+            description = f"A {rng.choice(['first', 'second', 'revised'])} course text on {title.lower()}."
+            document = " ".join([title, description, *(author_names[pk] for pk in book_authors),
+                                 *(subject_names[pk] for pk in book_subjects)])
+            book = Book(
+                title=title, description=description, publication_year=rng.randint(1950, 2025),
+                quantity=rng.choice((1, 1, 1, 2, 2, 3, 5)), search_document=document,
+            )
+            rows.append((book, book_authors, book_subjects))
+
+        created = timer.insert(Book, [book for book, _, _ in rows])
+        timer.insert_rows(AuthorLink, ['book', 'author'], [
+            (book.pk, pk) for book, book_authors, _ in rows for pk in book_authors
+        ])
+        timer.insert_rows(SubjectLink, ['book', 'subject'], [
+            (book.pk, pk) for book, _, book_subjects in rows for pk in book_subjects
+        ])
+        started = time.perf_counter()
+        # replace: after `manage.py flush` new books reuse ids the FTS table still holds
+        index_documents([(book.pk, book.title, book.search_document) for book in created],
+                        replace=[book.pk for book in created])
+        timer.add('search index', len(created), time.perf_counter() - started)
+        quantities.update((book.pk, book.quantity) for book in created)
+    return quantities
+
+
+def _seed_students(timer, rng, count, batch_size):
+    ids = []
+    for batch in _batches(range(count), batch_size):
+        students = []
+        for i in batch:
+            year, serial = TUP_YEARS[i % len(TUP_YEARS)], i // len(TUP_YEARS) + 1
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            tup_id = f"TUPM-{year:02d}-{serial:04d}"
+            # bulk_create skips Student.save(), which parses tup_id
+            tup_year, tup_serial = parse_tup_id(tup_id)
+            students.append(Student(
+                first=first, last=last, tup_id=tup_id, tup_year=tup_year, tup_serial=tup_serial,
+                email=f"{first}.{last}.{year:02d}{serial:04d}@tup.edu.ph".replace(" ", "").lower(),
+            ))
+        ids += [student.pk for student in timer.insert(Student, students)]
+    return ids
+
+
+def _seed_borrows(timer, rng, count, quantities, student_ids, batch_size):
+    if not count:
+        return
+    book_ids = list(quantities)
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    open_count = int(count * OPEN_RATIO)
+    history_count = count - open_count
+    # Carts average 1.75 books
+    open_days = max(7, math.ceil(open_count / 1.75 / VISITS_PER_DAY))
+    history_days = max(365, math.ceil(history_count / 1.75 / VISITS_PER_DAY))
+    open_start = today - datetime.timedelta(days=open_days)
+    history_start = open_start - datetime.timedelta(days=history_days)
+
+    def visits(total, start, end):
+        """(time, student, books) per desk visit until total loans are handed out, oldest first."""
+        made = 0
+        while made < total:
+            # The clock follows the loans handed out so far, so visits spread evenly over [start, end)
+            at = start + (end - start) * ((made + rng.random()) / total)
+            cart = min(rng.choice((1, 1, 2, 3)), total - made, len(book_ids))
+            books = set()
+            while len(books) < cart:
+                # Low ids are borrowed far more often, like a real catalog's bestsellers
+                books.add(book_ids[int(len(book_ids) * rng.random() ** 2)])
+            made += yield at, rng.choice(student_ids), sorted(books)
+
+    def loan(book, student, borrowed_date, returned):
+        """A LOAN_FIELDS row; updated_at is when the loan was made."""
+        hours = rng.choice(LOAN_HOURS)
+        due_date = borrowed_date + datetime.timedelta(hours=hours)
+        reminded = due_date - datetime.timedelta(hours=4) if returned else None
+        return book, student, borrowed_date, due_date, hours, returned, reminded, borrowed_date
+
+    def loans():
+        history = visits(history_count, history_start, open_start)
+        made = None
+        try:
+            while True:
+                borrowed_date, student, books = history.send(made)
+                for book in books:
+                    yield loan(book, student, borrowed_date, returned=True)
+                made = len(books)
+        except StopIteration:
+            pass
+
+        open_per_book, open_per_student, held = Counter(), Counter(), set()
+        current = visits(open_count, open_start, today)
+        made, attempts = None, 0
+        try:
+            # Carts that would break a limit are dropped; give up on the last few if the catalog is that busy
+            while attempts < 20 * open_count:
+                attempts += 1
+                borrowed_date, student, books = current.send(made)
+                books = [
+                    book for book in books
+                    if open_per_book[book] < quantities[book] and (student, book) not in held
+                ][:Borrow.MAX_ACTIVE_LOANS - open_per_student[student]]
+                for book in books:
+                    open_per_book[book] += 1
+                    held.add((student, book))
+                    yield loan(book, student, borrowed_date, returned=False)
+                open_per_student[student] += len(books)
+                made = len(books)
+        except StopIteration:
+            pass
+        _set_active_loans(timer, open_per_book)
+
+    day, day_students, days = None, set(), []
+    for batch in _batches(loans(), batch_size):
+        timer.insert_rows(Borrow, LOAN_FIELDS, batch)
+        borrowers = []
+        for _, student, borrowed_date, *_ in batch:
+            borrow_day = timezone.localdate(borrowed_date)
+            if borrow_day != day:
+                day, day_students = borrow_day, set()
+                days.append([day, 0])
+            if student not in day_students:
+                day_students.add(student)
+                days[-1][1] += 1
+                borrowers.append((day, student))
+        timer.insert_rows(DailyBorrower, ['day', 'student'], borrowers)
+    # The seeded students are new, so their counts add to whatever those days already hold
+    existing = set(DailyBorrowStats.objects.filter(day__gte=days[0][0]).values_list('day', flat=True))
+    for day, n in days:
+        if day in existing:
+            DailyBorrowStats.objects.filter(day=day).update(borrower_count=F('borrower_count') + n)
+    timer.insert(DailyBorrowStats, [DailyBorrowStats(day=day, borrower_count=n) for day, n in days if day not in existing])
+
+
+def _set_active_loans(timer, open_per_book):
+    started = time.perf_counter()
+    by_count = {}
+    for book, loans in open_per_book.items():
+        by_count.setdefault(loans, []).append(book)
+    for loans, books in by_count.items():
+        for batch in _batches(books, 5000):
+            Book.objects.filter(pk__in=batch).update(active_loans=loans)
+    timer.add('books.Book', 0, time.perf_counter() - started)
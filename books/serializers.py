@@ -1,13 +1,30 @@
 from rest_framework import serializers
-from .models import Book, Borrow, Student
+from .models import BackgroundJob, Book, Borrow, Student
 from django.utils import timezone
 
-class StudentSerializer(serializers.ModelSerializer):
+
+def requested_fields(request):
+    """The set of names in ?fields=a,b,c, or None when the client wants everything."""
+    if request is None or not request.query_params.get('fields'):
+        return None
+    return {name.strip() for name in request.query_params['fields'].split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    # Drops every field not listed in ?fields= before serialization starts
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+class StudentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Student
         fields = ['tup_id', 'first', 'last', 'email']
 
-class LibraryBooksSerializer(serializers.ModelSerializer):
+class LibraryBooksSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # This controls the MAIN DASHBOARD STATS (Borrowed/Available/Total)
     author = serializers.StringRelatedField(many=True)
     status = serializers.SerializerMethodField()
@@ -19,18 +36,15 @@ class LibraryBooksSerializer(serializers.ModelSerializer):
         fields = ["id", "author", "title", "cover_image", "cover_url", "status", "quantity", "available_copies"]
 
     def get_available_copies(self, obj):
-        active_borrows = Borrow.objects.filter(borrowing=obj, returned=False).count()
-        return max(0, obj.quantity - active_borrows)
+        return obj.available_copies
 
     def get_status(self, obj):
-        active_borrows = Borrow.objects.filter(borrowing=obj, returned=False).count()
-        # # This logic ensures the "Borrowed" count on the dashboard is correct
-        # if Borrow.objects.filter(borrowing=obj, returned=False).exists():
-        if active_borrows >= obj.quantity:
+        # This logic ensures the "Borrowed" count on the dashboard is correct
+        if not obj.is_available:
             return "Borrowed"
         return "Available"
 
-class BookDetailsSerializer(serializers.ModelSerializer):
+class BookDetailsSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     # This controls the individual book page
     author = serializers.StringRelatedField(many=True)
     subject = serializers.StringRelatedField(many=True)
@@ -43,17 +57,18 @@ class BookDetailsSerializer(serializers.ModelSerializer):
         fields = ["id", "title", "author", "publication_year", "subject", "description", "cover_image", "cover_url", "status", "quantity", "available_copies", "active_loans"]
 
     def get_available_copies(self, obj):
-        active_borrows = Borrow.objects.filter(borrowing=obj, returned=False).count()
-        return max(0, obj.quantity - active_borrows)
+        return obj.available_copies
 
     def get_status(self, obj):
-        active_borrows = Borrow.objects.filter(borrowing=obj, returned=False).count()
-        if active_borrows >= obj.quantity:
+        if not obj.is_available:
             return "Out of Stock"
         return "Available"
     
     def get_active_loans(self, obj):
-        borrows = Borrow.objects.filter(borrowing=obj, returned=False)
+        # Book.objects.with_open_loans() prefetches these with their borrowers
+        borrows = getattr(obj, 'open_loans', None)
+        if borrows is None:
+            borrows = Borrow.objects.filter(borrowing=obj, returned=False).select_related('borrower')
         return [
             {
                 "borrower": f"{b.borrower.first} {b.borrower.last} ({b.borrower.tup_id})",
@@ -75,23 +90,14 @@ class BookDetailsSerializer(serializers.ModelSerializer):
     #         }
     #     return None
 
-class StudentHistorySerializer(serializers.ModelSerializer):
-    # This controls the STUDENT HISTORY PAGE & PROFILE
+class StudentHistorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    # This controls the STUDENT HISTORY TABLE; the profile card comes from StudentSerializer once per response
     book_title = serializers.CharField(source='borrowing.title', read_only=True)
     status = serializers.SerializerMethodField()
 
-    # We restore these fields so the Profile Card doesn't say "undefined"
-    student_first = serializers.CharField(source='borrower.first')
-    student_last = serializers.CharField(source='borrower.last')
-    student_email = serializers.CharField(source='borrower.email')
-    student_tup_id = serializers.CharField(source='borrower.tup_id')
-
     class Meta:
         model = Borrow
-        fields = [
-            "student_first", "student_last", "student_email", "student_tup_id", # Profile Data
-            "book_title", "borrowed_date", "due_date", "status"                 # Table Data
-        ]
+        fields = ["id", "book_title", "borrowed_date", "due_date", "status"]
         
     def get_status(self, obj):    
         if obj.returned:
@@ -101,4 +107,25 @@ class StudentHistorySerializer(serializers.ModelSerializer):
         if obj.due_date < timezone.now():
             return "Overdue"
             
-        return "Active"
\ No newline at end of file
+        return "Active"
+
+class BorrowChangeSerializer(serializers.ModelSerializer):
+    # One row of the changes feed; clients upsert it by id into their dashboard mirror
+    book_id = serializers.IntegerField(source='borrowing_id')
+    book_title = serializers.CharField(source='borrowing.title')
+    student_name = serializers.SerializerMethodField()
+    student_id = serializers.CharField(source='borrower.tup_id')
+
+    class Meta:
+        model = Borrow
+        fields = ["id", "book_id", "book_title", "student_name", "student_id", "borrowed_date", "due_date", "returned", "updated_at"]
+
+    def get_student_name(self, obj):
+        return f"{obj.borrower.first} {obj.borrower.last}"
+
+class BackgroundJobSerializer(serializers.ModelSerializer):
+    remaining = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = BackgroundJob
+        fields = ["id", "kind", "status", "total", "sent", "failed", "remaining", "error", "created_at", "started_at", "finished_at"]
\ No newline at end of file
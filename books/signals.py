@@ -0,0 +1,137 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import invalidate_books
+from .events import publish_loan_events
+from .models import Author, Book, Borrow, DataVersion, Student, Subject
+from .search import refresh_search_documents, remove_search_document
+
+
+@receiver(post_delete, sender=Borrow)
+def release_active_loan(sender, instance, **kwargs):
+    # Runs for direct deletes and for cascades from Book/Student, which skip Borrow.delete()
+    held_book_id = getattr(instance, '_held_book_id', None)
+    if held_book_id is not None:
+        Book.objects.filter(pk=held_book_id, active_loans__gt=0).update(
+            active_loans=F('active_loans') - 1, updated_at=timezone.now()
+        )
+        instance._held_book_id = None
+
+
+# --- Search index sync (books/search.py) ---
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and not {'title', 'description'} & set(update_fields)):
+        return
+    refresh_search_documents([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    remove_search_document(instance.pk)
+
+
+@receiver(m2m_changed, sender=Book.author.through)
+@receiver(m2m_changed, sender=Book.subject.through)
+def index_book_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # author.book_set.clear() reports no pk_set afterwards, so remember the books now
+        instance._affected_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        refresh_search_documents(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        refresh_search_documents(getattr(instance, '_affected_book_ids', []) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Subject)
+def index_renamed_name(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    refresh_search_documents(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Subject)
+def remember_named_books(sender, instance, **kwargs):
+    instance._affected_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Subject)
+def index_removed_name(sender, instance, **kwargs):
+    refresh_search_documents(getattr(instance, '_affected_book_ids', []))
+
+
+# --- Response cache invalidation (books/caching.py) and ETag versions (DataVersion) ---
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book(sender, instance, **kwargs):
+    # Titles also appear on the admin dashboard
+    DataVersion.bump(DataVersion.CATALOG, DataVersion.CIRCULATION)
+    invalidate_books([instance.pk])
+
+
+def touch_books(book_ids):
+    """Stamp updated_at on books whose authors or subjects changed, so the changes feed resends them."""
+    book_ids = list(book_ids)
+    Book.objects.filter(pk__in=book_ids).update(updated_at=timezone.now())
+    return book_ids
+
+
+@receiver(m2m_changed, sender=Book.author.through)
+@receiver(m2m_changed, sender=Book.subject.through)
+def invalidate_book_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        DataVersion.bump(DataVersion.CATALOG)
+        invalidate_books(touch_books(pk_set if reverse else [instance.pk]))
+    elif action == 'post_clear':
+        DataVersion.bump(DataVersion.CATALOG)
+        invalidate_books(touch_books(getattr(instance, '_affected_book_ids', []) if reverse else [instance.pk]))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Subject)
+def invalidate_renamed_name(sender, instance, created, **kwargs):
+    if not created:
+        DataVersion.bump(DataVersion.CATALOG)
+        invalidate_books(touch_books(instance.book_set.values_list('pk', flat=True)))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Subject)
+def invalidate_removed_name(sender, instance, **kwargs):
+    DataVersion.bump(DataVersion.CATALOG)
+    invalidate_books(touch_books(getattr(instance, '_affected_book_ids', [])))
+
+
+@receiver(post_save, sender=Borrow)
+@receiver(post_delete, sender=Borrow)
+def invalidate_loan(sender, instance, **kwargs):
+    # Checkouts and returns change availability and the details' active_loans list
+    DataVersion.bump(DataVersion.CATALOG, DataVersion.CIRCULATION)
+    invalidate_books([instance.borrowing_id])
+
+
+@receiver(post_save, sender=Borrow)
+def publish_loan_event(sender, instance, created, raw=False, **kwargs):
+    # bulk circulation publishes its own; see circulation.process_carts
+    if raw:
+        return
+    if created:
+        publish_loan_events('borrow', [instance])
+    elif instance.returned and getattr(instance, '_held_book_id', None) is not None:
+        # Still the pre-save state here: Borrow.save() updates it after the write
+        publish_loan_events('return', [instance])
+
+
+@receiver(post_save, sender=Student)
+def invalidate_borrower_name(sender, instance, created, **kwargs):
+    # Book details and the dashboard name the current borrowers
+    if not created:
+        DataVersion.bump(DataVersion.CIRCULATION)
+        invalidate_books(Borrow.objects.filter(borrower=instance, returned=False).values_list('borrowing_id', flat=True))
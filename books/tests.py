@@ -1,3 +1,1073 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import re
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import benchmarks, changes, events, jobs, seeding
+from .caching import get_cache, invalidate_books
+from .middleware import fingerprint
+from .circulation import borrow_book, process_carts, return_book
+from .management.commands.process_email_outbox import Command as OutboxWorker
+from .models import Author, BackgroundJob, Book, Borrow, DailyBorrowStats, OutboundEmail, Student, Subject
+from .urls import urlpatterns
+
+
+def run_concurrently(targets):
+    """Start every target at the same moment on its own thread and DB connection."""
+    barrier = threading.Barrier(len(targets))
+    outcomes = [None] * len(targets)
+
+    def worker(index, target):
+        try:
+            barrier.wait()
+            outcomes[index] = target()
+        except Exception as e:
+            outcomes[index] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i, t)) for i, t in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+class ConcurrentCirculationTests(TransactionTestCase):
+    """Stress the checkout path from many threads; needs PostgreSQL or a file-backed SQLite (WAL) test DB."""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("threads can't share an in-memory SQLite database")
+        self.students = [
+            Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            for i in range(12)
+        ]
+
+    def test_last_copies_are_never_oversubscribed(self):
+        book = Book.objects.create(title="Contended", publication_year=2020, quantity=3)
+
+        outcomes = run_concurrently([
+            lambda student=student: borrow_book(student, book) for student in self.students
+        ])
+
+        borrowed = [o for o in outcomes if isinstance(o, Borrow)]
+        refused = [o for o in outcomes if isinstance(o, ValidationError)]
+        self.assertEqual(len(borrowed), 3)
+        self.assertEqual(len(refused), len(self.students) - 3)
+        book.refresh_from_db()
+        self.assertEqual(book.active_loans, 3)
+        self.assertEqual(Borrow.objects.filter(borrowing=book, returned=False).count(), 3)
+
+    def test_student_loan_limit_holds_across_terminals(self):
+        student = self.students[0]
+        books = [Book.objects.create(title=f"Book {i}", publication_year=2020, quantity=5) for i in range(8)]
+
+        run_concurrently([lambda book=book: borrow_book(student, book) for book in books])
+
+        self.assertEqual(Borrow.objects.filter(borrower=student, returned=False).count(), 3)
+        self.assertEqual(sum(Book.objects.values_list('active_loans', flat=True)), 3)
+
+    def test_single_returns_and_carts_on_one_book_run_together(self):
+        book = Book.objects.create(title="Shared", publication_year=2020, quantity=4)
+        for student in self.students[:4]:
+            borrow_book(student, book)
+
+        outcomes = run_concurrently(
+            [lambda student=student: return_book(student, book) for student in self.students[:2]]
+            + [lambda student=student: process_carts('return', [{"tup_id": student.tup_id, "book_ids": [book.pk]}])
+               for student in self.students[2:4]]
+        )
+
+        self.assertFalse([o for o in outcomes if isinstance(o, Exception)], outcomes)
+        book.refresh_from_db()
+        self.assertEqual(book.active_loans, 0)
+
+    def test_concurrent_returns_release_one_copy(self):
+        student = self.students[0]
+        book = Book.objects.create(title="Returned twice", publication_year=2020, quantity=1)
+        borrow_book(student, book)
+
+        outcomes = run_concurrently([lambda: return_book(student, book) for _ in range(6)])
+
+        self.assertEqual(len([o for o in outcomes if isinstance(o, Borrow)]), 1)
+        book.refresh_from_db()
+        self.assertEqual(book.active_loans, 0)
+
+
+class BatchCirculationTests(TestCase):
+    def setUp(self):
+        self.students = [
+            Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            for i in range(4)
+        ]
+        self.books = [Book.objects.create(title=f"Book {i}", publication_year=2020, quantity=2) for i in range(5)]
+
+    def carts(self, book_ids):
+        return [{"tup_id": student.tup_id, "book_ids": book_ids} for student in self.students]
+
+    def test_batch_uses_constant_queries(self):
+        book_ids = [book.pk for book in self.books]
+        DailyBorrowStats.objects.get_or_create(day=timezone.localdate())
+        # savepoint, 3 locking reads, 2 daily-limit reads, bulk insert, 2 daily-limit writes,
+        # counter update, outbox insert, release; the version bump waits for the commit
+        with self.assertNumQueries(12):
+            output = process_carts('borrow', self.carts(book_ids))
+
+        self.assertEqual([len(cart["results"]) for cart in output], [5, 5, 5, 5])
+        self.assertEqual(Borrow.objects.filter(returned=False).count(), 10)
+        self.assertEqual(list(Book.objects.order_by('pk').values_list('active_loans', flat=True)), [2, 2, 2, 2, 2])
+        self.assertTrue(output[2]["results"][0].startswith("⛔"))
+        self.assertIn("limit of 3 books", output[0]["results"][3])
+
+        # savepoint, 3 locking reads, bulk update, counter update, release
+        with self.assertNumQueries(7):
+            process_carts('return', self.carts(book_ids))
+        self.assertFalse(Borrow.objects.filter(returned=False).exists())
+        self.assertEqual(sum(Book.objects.values_list('active_loans', flat=True)), 0)
+
+    def test_single_return_locks_in_the_batch_order(self):
+        borrow_book(self.students[0], self.books[0])
+        with CaptureQueriesContext(connection) as ctx:
+            return_book(self.students[0], self.books[0])
+        # Student, then book, then loan, as process_carts() locks them
+        tables = [re.search(r'FROM "(\w+)"', q["sql"]).group(1) for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertEqual(tables[:3], ["books_student", "books_book", "books_borrow"])
+
+    def test_unknown_student_and_book_are_reported_per_item(self):
+        output = process_carts('borrow', [
+            {"tup_id": "TUPM-00-0000", "book_ids": [self.books[0].pk]},
+            {"tup_id": self.students[0].tup_id, "book_ids": [999999, self.books[0].pk, self.books[0].pk]},
+        ])
+
+        self.assertEqual(output[0]["results"], ["⚠️ Student not found"])
+        self.assertEqual(output[1]["results"], [
+            "⚠️ Book 999999: Not found",
+            "✅ Book 0: Successfully Borrowed",
+            "❌Book 0: Already borrowed",
+        ])
+
+    def test_malformed_carts_are_a_400(self):
+        url = reverse('library:api_circulation_batch')
+        for carts in ("x", [1], [{"tup_id": ["TUPM-25-0000"]}], [{"tup_id": "TUPM-25-0000", "book_ids": 5}], {"tup_id": "x"}):
+            response = self.client.post(url, {"action": "borrow", "carts": carts}, content_type='application/json')
+            self.assertEqual(response.status_code, 400, carts)
+            self.assertEqual(response.json()["status"], "error")
+        self.assertFalse(Borrow.objects.exists())
+
+
+class ActiveLoanCounterTests(TestCase):
+    def setUp(self):
+        self.students = [
+            Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            for i in range(2)
+        ]
+        self.book = Book.objects.create(title="Counted", publication_year=2020, quantity=3)
+        self.other = Book.objects.create(title="Other", publication_year=2020, quantity=3)
+
+    def counts(self):
+        return [book.active_loans for book in Book.objects.filter(pk__in=[self.book.pk, self.other.pk]).order_by('pk')]
+
+    def test_counter_follows_borrow_return_and_delete(self):
+        first = borrow_book(self.students[0], self.book)
+        borrow_book(self.students[1], self.book)
+        self.assertEqual(self.counts(), [2, 0])
+
+        return_book(self.students[0], self.book)
+        self.assertEqual(self.counts(), [1, 0])
+        # Deleting a closed loan releases nothing
+        first.delete()
+        self.assertEqual(self.counts(), [1, 0])
+
+        # Moving an open loan to another book moves the copy with it
+        loan = Borrow.objects.get(borrower=self.students[1], returned=False)
+        loan.borrowing = self.other
+        loan.save()
+        self.assertEqual(self.counts(), [0, 1])
+
+        loan.delete()
+        self.assertEqual(self.counts(), [0, 0])
+
+        # Cascades from the student skip Borrow.delete() but still release the copy
+        borrow_book(self.students[0], self.book)
+        self.students[0].delete()
+        self.assertEqual(self.counts(), [0, 0])
+
+    def test_reconcile_command_repairs_drift(self):
+        borrow_book(self.students[0], self.book)
+        borrow_book(self.students[1], self.book)
+        Book.objects.filter(pk=self.book.pk).update(active_loans=0)
+        Book.objects.filter(pk=self.other.pk).update(active_loans=3)
+
+        out = StringIO()
+        call_command('reconcile_active_loans', stdout=out)
+        self.assertIn("Fixed active_loans on 2 book(s).", out.getvalue())
+        self.assertEqual(self.counts(), [2, 0])
+
+        out = StringIO()
+        call_command('reconcile_active_loans', stdout=out)
+        self.assertIn("All active_loans counters are in sync.", out.getvalue())
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(first="Ana", last="Test", tup_id="TUPM-25-0001", email="ana@example.com")
+        self.book = Book.objects.create(title="Queued", publication_year=2020, quantity=2)
+
+    def test_checkout_only_enqueues(self):
+        borrow = borrow_book(self.student, self.book)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.get().dedupe_key, borrow.borrow_confirmation_key())
+
+        borrow.queue_borrow_confirmation()
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_worker_delivers_each_email_once(self):
+        borrow_book(self.student, self.book)
+
+        call_command('process_email_outbox', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboundEmail.objects.get().status, OutboundEmail.SENT)
+
+        call_command('process_email_outbox', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_delivery_is_rescheduled(self):
+        borrow_book(self.student, self.book)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError("smtp down")):
+            call_command('process_email_outbox', '--once', stdout=StringIO())
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertIn("smtp down", email.last_error)
+
+    def test_lapsed_claim_is_not_sent_again(self):
+        borrow_book(self.student, self.book)
+        worker = OutboxWorker(stdout=StringIO())
+        worker.options, worker.connection = {'batch_size': 50, 'max_attempts': 5, 'backoff': 30.0}, None
+        batch = worker.claim_batch()
+
+        # This worker stalls past its claim; another claims the row and sends it
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        call_command('process_email_outbox', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+        self.assertEqual(worker.deliver(batch), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_blank_addresses_are_not_queued(self):
+        message = mail.EmailMessage("Subject", "Body", "library@example.com", [""])
+        OutboundEmail.enqueue(message, "blank")
+        self.assertFalse(OutboundEmail.objects.exists())
+
+
+class OverdueNoticeTests(TestCase):
+    def test_one_notice_per_student_with_constant_queries(self):
+        past = timezone.now() - datetime.timedelta(days=2)
+        for i in range(3):
+            student = Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            for j in range(2):
+                book = Book.objects.create(title=f"Book {i}-{j}", publication_year=2020)
+                Borrow.objects.create(borrower=student, borrowing=book, borrowed_date=past, due_date=past)
+        mail.outbox.clear()
+
+        out = StringIO()
+        with self.assertNumQueries(1):
+            call_command('send_overdue_notices', stdout=out)
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("'Book 0-0'", mail.outbox[0].body)
+        self.assertIn("'Book 0-1'", mail.outbox[0].body)
+        self.assertIn("3 overdue emails covering 6 books for 3 students", out.getvalue())
+
+        call_command('send_overdue_notices', '--dry-run', '--limit', '1', stdout=out)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("Would send 1 overdue emails", out.getvalue())
+
+
+class BackgroundJobTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("the job thread can't share an in-memory SQLite database")
+
+    def test_trigger_emails_returns_job_and_reports_progress(self):
+        past = timezone.now() - datetime.timedelta(days=1)
+        for i in range(3):
+            student = Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            book = Book.objects.create(title=f"Book {i}", publication_year=2020)
+            Borrow.objects.create(borrower=student, borrowing=book, borrowed_date=past, due_date=past)
+
+        response = self.client.post(reverse('library:trigger-emails'))
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+
+        jobs._executor.submit(lambda: None).result()  # wait for the queued job to finish
+
+        status = self.client.get(reverse('library:job-status', args=[job_id])).json()
+        self.assertEqual(status['status'], BackgroundJob.SUCCEEDED)
+        self.assertEqual((status['total'], status['sent'], status['failed'], status['remaining']), (3, 3, 0, 0))
+
+
+class ReminderSchedulerTests(TestCase):
+    def test_only_loans_entering_the_window_are_reminded_once(self):
+        student = Student.objects.create(first="Ana", last="Test", tup_id="TUPM-25-0001", email="ana@example.com")
+        now = timezone.now()
+        for hours in (1, 4, 10):
+            book = Book.objects.create(title=f"Due in {hours}h", publication_year=2020)
+            Borrow.objects.create(borrower=student, borrowing=book, due_date=now + datetime.timedelta(hours=hours))
+        OutboundEmail.objects.all().delete()
+
+        call_command('send_reminders', stdout=StringIO())
+        call_command('send_reminders', stdout=StringIO())
+
+        reminder = OutboundEmail.objects.get()
+        self.assertEqual(reminder.subject, "Reminder to Return Book Soon!")
+        self.assertIn("Due in 4h", reminder.body)
+        self.assertEqual(Borrow.objects.filter(reminder_sent_at__isnull=False).count(), 1)
+
+
+class BorrowIndexUsageTests(TestCase):
+    """EXPLAIN every Borrow query the hot endpoints issue and fail on a full table scan."""
+
+    def setUp(self):
+        # Cached responses would hide the queries being checked
+        get_cache().clear()
+        self.student = Student.objects.create(first="Ana", last="Test", tup_id="TUPM-25-0001", email="ana@example.com")
+        self.books = [Book.objects.create(title=f"Book {i}", publication_year=2020, quantity=2) for i in range(3)]
+        past = timezone.now() - datetime.timedelta(days=2)
+        Borrow.objects.create(borrower=self.student, borrowing=self.books[0])
+        Borrow.objects.create(borrower=self.student, borrowing=self.books[1], borrowed_date=past, due_date=past)
+
+    def borrow_plans(self, queries):
+        plans = []
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'books_borrow' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    # Tiny test tables always seq-scan otherwise; we want to know an index *can* serve the query
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                    cursor.execute('EXPLAIN ' + sql)
+                else:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, "\n".join(str(row[-1]) for row in cursor.fetchall())))
+        self.assertTrue(plans, "no Borrow queries captured")
+        return plans
+
+    def assertNoBorrowTableScan(self, queries):
+        full_scan = re.compile(r'Seq Scan on books_borrow|^SCAN (TABLE )?(books_borrow|U\d+)\b(?! USING)', re.MULTILINE)
+        for sql, plan in self.borrow_plans(queries):
+            self.assertIsNone(full_scan.search(plan), f"{plan}\n{sql}")
+
+    def test_admin_dashboard(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('library:admin-dashboard'))
+        self.assertNoBorrowTableScan(ctx.captured_queries)
+
+    def test_circulation(self):
+        url = reverse('library:api_circulation')
+        payload = {"tup_id": self.student.tup_id, "book_ids": [self.books[2].pk]}
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(url, {**payload, "action": "borrow"}, content_type='application/json')
+            self.client.post(url, {**payload, "action": "return"}, content_type='application/json')
+            process_carts('borrow', [payload])
+        self.assertNoBorrowTableScan(ctx.captured_queries)
+
+    def test_student_history(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('library:api_student_history', args=[self.student.tup_id]), {'limit': 1})
+        self.assertNoBorrowTableScan(ctx.captured_queries)
+
+    def test_catalog_serializers(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('library:api_book_detail', args=[self.books[0].pk]))
+            Book.objects.with_counted_loans().count()
+        self.assertNoBorrowTableScan(ctx.captured_queries)
+
+
+
+class DailyBorrowLimitTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("threads can't share an in-memory SQLite database")
+
+    def test_concurrent_checkouts_never_exceed_the_daily_limit(self):
+        students = [
+            Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            for i in range(10)
+        ]
+        book = Book.objects.create(title="Popular", publication_year=2020, quantity=10)
+
+        with mock.patch.object(Borrow, 'DAILY_LIMIT', 4):
+            run_concurrently([lambda student=student: borrow_book(student, book) for student in students])
+            self.assertEqual(Borrow.get_today_borrow_count(), 4)
+            self.assertEqual(Borrow.get_daily_limit_remaining(), 0)
+
+        self.assertEqual(Borrow.objects.count(), 4)
+
+
+class CatalogSearchTests(TestCase):
+    def setUp(self):
+        self.rowling = Author.objects.create(name="J.K. Rowling")
+        self.potter = Book.objects.create(title="Harry Potter", description="A young wizard", publication_year=1997, quantity=2)
+        self.potter.author.add(self.rowling)
+        self.hobbit = Book.objects.create(title="The Hobbit", description="Harry the dragon-hunter", publication_year=1937, quantity=1)
+
+    def search(self, q):
+        response = self.client.get(reverse('library:api_book_search'), {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_prefix_match_ranks_title_hits_first(self):
+        data = self.search("harr")
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([book['title'] for book in data['results']], ["Harry Potter", "The Hobbit"])
+
+    def test_misspelled_terms_are_corrected(self):
+        data = self.search("hary poter")
+        self.assertEqual(data['corrected_query'], "harry potter")
+        self.assertEqual([book['title'] for book in data['results']], ["Harry Potter"])
+
+    def test_author_changes_resync_the_index(self):
+        self.assertEqual(self.search("rowling")['count'], 1)
+        self.rowling.name = "Robert Galbraith"
+        self.rowling.save()
+        self.assertEqual(self.search("galbraith")['count'], 1)
+        self.potter.author.clear()
+        self.assertEqual(self.search("galbraith")['count'], 0)
+
+
+class CatalogFilterTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.url = reverse('library:api_book_list')
+        rowling, galbraith = Author.objects.create(name="J.K. Rowling"), Author.objects.create(name="Robert Galbraith")
+        fantasy, crime = Subject.objects.create(name="Fantasy"), Subject.objects.create(name="Crime")
+        self.potter = Book.objects.create(title="Philosopher's Stone", publication_year=1997, quantity=1)
+        self.potter.author.add(rowling)
+        self.potter.subject.add(fantasy)
+        self.cuckoo = Book.objects.create(title="The Cuckoo's Calling", publication_year=2013, quantity=2)
+        # Both names match "r", so an EXISTS subquery must still return the book once
+        self.cuckoo.author.add(rowling, galbraith)
+        self.cuckoo.subject.add(crime)
+        self.plain = Book.objects.create(title="Untitled", publication_year=2005, quantity=1, description="x" * 500)
+        student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        borrow_book(student, self.potter)
+
+    def titles(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [book["title"] for book in response.json()]
+
+    def test_filters(self):
+        self.assertEqual(self.titles(author="galbraith"), ["The Cuckoo's Calling"])
+        self.assertEqual(self.titles(author="r"), ["Philosopher's Stone", "The Cuckoo's Calling"])
+        self.assertEqual(self.titles(subject="fanta"), ["Philosopher's Stone"])
+        self.assertEqual(self.titles(available="true"), ["The Cuckoo's Calling", "Untitled"])
+        self.assertEqual(self.titles(year_min=2000), ["The Cuckoo's Calling", "Untitled"])
+        self.assertEqual(self.titles(year_max=2005), ["Philosopher's Stone", "Untitled"])
+        self.assertEqual(self.titles(year_min=2000, year_max=2010, available="1"), ["Untitled"])
+        self.assertEqual(self.titles(author="rowling", subject="crime"), ["The Cuckoo's Calling"])
+
+    def test_invalid_filter_is_a_400(self):
+        for params in ({"year_min": "nineties"}, {"year_max": "2000.5"}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("must be a year", response.json()["detail"])
+
+    def test_pages_are_complete_and_stable(self):
+        for i in range(4):
+            Book.objects.create(title=f"Extra {i}", publication_year=2020)
+        everything = [book["id"] for book in self.client.get(self.url).json()]
+
+        page = self.client.get(self.url, {"page_size": 2}).json()
+        seen = [book["id"] for book in page["results"]]
+        # A book added mid-walk lands after the cursor and shifts nothing already served
+        added = Book.objects.create(title="Late", publication_year=2021)
+        while page["next"]:
+            page = self.client.get(page["next"]).json()
+            self.assertLessEqual(len(page["results"]), 2)
+            seen += [book["id"] for book in page["results"]]
+        self.assertEqual(seen, everything + [added.pk])
+
+        filtered = self.client.get(self.url, {"page_size": 1, "available": "true"}).json()
+        self.assertEqual(filtered["results"][0]["title"], "The Cuckoo's Calling")
+
+    def test_fields_trims_the_response_and_the_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(self.url, {"fields": "id,title,status"}).json()
+        self.assertEqual([set(book) for book in data], [{"id", "title", "status"}] * 3)
+        self.assertEqual(data[0]["status"], "Borrowed")
+        book_query = next(q["sql"] for q in ctx.captured_queries if 'FROM "books_book"' in q["sql"])
+        self.assertNotIn('"description"', book_query)
+        self.assertNotIn('"search_document"', book_query)
+        # No author prefetch, and nothing deferred gets loaded row by row
+        self.assertEqual(sum('FROM "books_book"' in q["sql"] for q in ctx.captured_queries), 1)
+        self.assertFalse(any('books_book_author' in q["sql"] for q in ctx.captured_queries))
+
+
+class CatalogResponseCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        self.book = Book.objects.create(title="Cached", publication_year=2020, quantity=1)
+
+    def test_repeat_reads_hit_the_cache_and_honour_conditional_headers(self):
+        url = reverse('library:api_book_list')
+        with tempfile.TemporaryDirectory() as location:
+            shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+            with override_settings(CACHES=shared):
+                first = self.client.get(url)
+                # Only the DataVersion lookup behind the strong ETag
+                with self.assertNumQueries(1):
+                    second = self.client.get(url)
+                self.assertEqual(second.content, first.content)
+                self.assertEqual(second['ETag'], first['ETag'])
+
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+                # Second-resolution dates could hide a write made in the same second
+                self.assertNotIn('Last-Modified', first)
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code, 200)
+
+                scrape = self.client.get(reverse('library:api_cache_metrics')).content.decode()
+        # The If-None-Match request is answered by the version check before the cache is consulted
+        self.assertIn('library_response_cache_hits_total{endpoint="book_list"} 2', scrape)
+        self.assertIn('library_response_cache_misses_total{endpoint="book_list"} 1', scrape)
+        self.assertIn('library_response_cache_not_modified_total{endpoint="book_list"} 0', scrape)
+
+    def test_signed_in_pages_are_never_served_to_others(self):
+        for path in (reverse('library:api_book_list'), reverse('library:api_book_detail', args=[self.book.pk])):
+            alice = Client()
+            alice.force_login(get_user_model().objects.get_or_create(username="alice")[0])
+            self.assertContains(alice.get(path, HTTP_ACCEPT='text/html'), "alice")
+            alice.get(path)
+
+            anonymous = self.client.get(path, HTTP_ACCEPT='text/html')
+            self.assertEqual(anonymous.status_code, 200)
+            self.assertNotContains(anonymous, "alice")
+
+        # Anonymous JSON is still cached: only the version lookup behind the ETag
+        list_url = reverse('library:api_book_list')
+        self.client.get(list_url)
+        with self.assertNumQueries(1):
+            self.client.get(list_url)
+
+    def test_metrics_are_refused_from_a_per_process_cache(self):
+        self.assertEqual(self.client.get(reverse('library:api_cache_metrics')).status_code, 501)
+
+    def test_a_bump_from_another_worker_invalidates_this_ones_entries(self):
+        detail = reverse('library:api_book_detail', args=[self.book.pk])
+        self.assertEqual(self.client.get(detail).json()["title"], "Cached")
+
+        # What another process's write leaves behind: new rows and versions, this process's cache untouched
+        Book.objects.filter(pk=self.book.pk).update(title="Renamed")
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_books([self.book.pk])
+        self.assertEqual(self.client.get(detail).json()["title"], "Renamed")
+
+    def test_checkouts_and_renames_invalidate_affected_responses(self):
+        detail = reverse('library:api_book_detail', args=[self.book.pk])
+        self.assertEqual(self.client.get(detail).json()["available_copies"], 1)
+        self.client.get(reverse('library:api_book_list'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            borrow_book(self.student, self.book)
+        self.assertEqual(self.client.get(detail).json()["available_copies"], 0)
+        self.assertEqual(self.client.get(reverse('library:api_book_list')).json()[0]["status"], "Borrowed")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.first = "Anna"
+            self.student.save()
+        self.assertIn("Anna Cruz", self.client.get(detail).json()["active_loans"][0]["borrower"])
+
+
+class VersionedETagTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        self.book = Book.objects.create(title="Polled", publication_year=2020, quantity=2)
+
+    def test_unchanged_poll_costs_one_query_and_a_304(self):
+        for url in (reverse('library:api_book_list'), reverse('library:admin-dashboard')):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_writes_change_the_etag(self):
+        list_url, dashboard_url = reverse('library:api_book_list'), reverse('library:admin-dashboard')
+        list_etag, dashboard_etag = self.client.get(list_url)['ETag'], self.client.get(dashboard_url)['ETag']
+
+        # The versions move once the checkout commits
+        with self.captureOnCommitCallbacks(execute=True):
+            borrow_book(self.student, self.book)
+
+        response = self.client.get(list_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["available_copies"], 1)
+        self.assertNotEqual(response['ETag'], list_etag)
+        response = self.client.get(dashboard_url, HTTP_IF_NONE_MATCH=dashboard_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["active"]), 1)
+
+
+@mock.patch.object(changes, 'SETTLE', datetime.timedelta(0))
+class ChangesFeedTests(TestCase):
+    # Read at import, before the class-level patch zeroes it
+    settle = changes.SETTLE
+
+    def setUp(self):
+        self.student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        self.book = Book.objects.create(title="Mirrored", publication_year=2020, quantity=2)
+        self.other = Book.objects.create(title="Untouched", publication_year=2020, quantity=1)
+
+    def poll(self, since=None):
+        response = self.client.get(reverse('library:api_changes'), {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_feed_returns_only_rows_written_after_the_cursor(self):
+        borrow_book(self.student, self.book)
+        first = self.poll()
+        self.assertEqual({book["title"] for book in first["books"]}, {"Mirrored", "Untouched"})
+        self.assertEqual([borrow["returned"] for borrow in first["borrows"]], [False])
+        self.assertEqual(self.poll(first["cursor"])["books"], [])
+
+        # The bulk return path stamps updated_at itself
+        process_carts('return', [{"tup_id": self.student.tup_id, "book_ids": [self.book.pk]}])
+        second = self.poll(first["cursor"])
+        self.assertEqual([(book["title"], book["available_copies"]) for book in second["books"]], [("Mirrored", 2)])
+        self.assertEqual([borrow["returned"] for borrow in second["borrows"]], [True])
+
+    def test_author_and_subject_changes_resend_the_book(self):
+        author = Author.objects.create(name="Writer")
+        subject = Subject.objects.create(name="Essays")
+        cursor = self.poll()["cursor"]
+
+        self.book.author.add(author)
+        changed = self.poll(cursor)
+        self.assertEqual([(book["title"], book["author"]) for book in changed["books"]], [("Mirrored", ["Writer"])])
+
+        subject.book_set.add(self.other)
+        changed = self.poll(changed["cursor"])
+        self.assertEqual([book["title"] for book in changed["books"]], ["Untouched"])
+
+        author.name = "Renamed Writer"
+        author.save()
+        changed = self.poll(changed["cursor"])
+        self.assertEqual([book["author"] for book in changed["books"]], [["Renamed Writer"]])
+
+        self.book.author.clear()
+        changed = self.poll(changed["cursor"])
+        self.assertEqual([book["author"] for book in changed["books"]], [[]])
+
+        subject.delete()
+        self.assertEqual([book["title"] for book in self.poll(changed["cursor"])["books"]], ["Untouched"])
+
+    def test_rows_are_held_back_for_longer_than_a_lock_wait(self):
+        now = timezone.now()
+        # Stamped, then blocked for most of the lock timeout before committing
+        Book.objects.filter(pk=self.other.pk).update(updated_at=now - datetime.timedelta(seconds=settings.DATABASE_LOCK_TIMEOUT - 1))
+        Book.objects.filter(pk=self.book.pk).update(updated_at=now - self.settle - datetime.timedelta(seconds=1))
+        with mock.patch.object(changes, 'SETTLE', self.settle):
+            first = self.poll()
+        # The cursor stops short of the late row, so a later poll still delivers it
+        self.assertEqual([book["title"] for book in first["books"]], ["Mirrored"])
+        self.assertEqual([book["title"] for book in self.poll(first["cursor"])["books"]], ["Untouched"])
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('library:api_changes'), {'since': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminDashboardTests(TestCase):
+    def setUp(self):
+        self.url = reverse('library:admin-dashboard')
+        now = timezone.now()
+        self.students = [
+            Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            for i in range(3)
+        ]
+        book = Book.objects.create(title="Shelved", publication_year=2020, quantity=10)
+        # Due in 1, 2 and 3 days, and overdue by 1, 2 and 3 days
+        self.active = [
+            Borrow.objects.create(borrower=self.students[i], borrowing=book, due_date=now + datetime.timedelta(days=i + 1))
+            for i in range(3)
+        ]
+        self.overdue = [
+            Borrow.objects.create(borrower=self.students[i], borrowing=book, borrowed_date=now - datetime.timedelta(days=5),
+                                  due_date=now - datetime.timedelta(days=3 - i))
+            for i in range(3)
+        ]
+        Borrow.objects.create(borrower=self.students[0], borrowing=book, returned=True, due_date=now - datetime.timedelta(days=9))
+
+    def ids(self, rows):
+        return [row["id"] for row in rows]
+
+    def test_open_loans_are_split_into_active_and_overdue(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(set(data), {"active", "overdue"})
+        self.assertEqual(self.ids(data["active"]), [b.pk for b in self.active])
+        self.assertEqual(self.ids(data["overdue"]), [b.pk for b in self.overdue])
+        self.assertEqual(set(data["active"][0]), {"id", "student_name", "student_id", "book_title", "due_date", "status"})
+        self.assertEqual(data["active"][0]["student_name"], "S0 Test")
+        self.assertEqual(data["active"][0]["book_title"], "Shelved")
+        self.assertEqual(data["active"][0]["due_date"], self.active[0].due_date.date().isoformat())
+        self.assertRegex(data["active"][0]["status"], r"^2[34]\.\d hours left$")
+        self.assertRegex(data["overdue"][0]["status"], r"^Overdue by \d+ days$")
+
+    def test_loans_without_a_due_date_are_left_out(self):
+        # Only bulk writes can leave one; save() always fills it in
+        Borrow.objects.filter(pk=self.active[0].pk).update(due_date=None)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.active[0].pk, self.ids(response.json()["active"]))
+        self.assertEqual(len(self.client.get(self.url, {"limit": 10}).json()["active"]), 2)
+
+    def test_limit_pages_each_list_with_its_own_cursor(self):
+        first = self.client.get(self.url, {"limit": 2}).json()
+        self.assertEqual(self.ids(first["active"]), [b.pk for b in self.active[:2]])
+        self.assertEqual(self.ids(first["overdue"]), [b.pk for b in self.overdue[:2]])
+
+        second = self.client.get(self.url, {"limit": 2, "active_cursor": first["active_next"]}).json()
+        self.assertEqual(self.ids(second["active"]), [self.active[2].pk])
+        self.assertIsNone(second["active_next"])
+        # The overdue list starts over without its cursor
+        self.assertEqual(self.ids(second["overdue"]), [b.pk for b in self.overdue[:2]])
+
+        last = self.client.get(self.url, {"limit": 2, "overdue_cursor": first["overdue_next"]}).json()
+        self.assertEqual(self.ids(last["overdue"]), [self.overdue[2].pk])
+        self.assertIsNone(last["overdue_next"])
+
+    def test_bad_limit_or_cursor_is_a_400(self):
+        for params in ({"limit": "many"}, {"limit": 2, "active_cursor": "not-a-cursor"}, {"limit": 2, "overdue_cursor": "eHx5"}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(response.json()["status"], "error")
+
+
+class DashboardEventTests(TestCase):
+    async def test_stream_pushes_published_events(self):
+        response = await self.async_client.get(reverse('library:dashboard-events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        chunks = asyncio.Queue()
+
+        async def consume():
+            # Iterated the way the ASGI handler does
+            async for chunk in response:
+                await chunks.put(chunk)
+
+        consumer = asyncio.create_task(consume())
+        self.assertEqual(await asyncio.wait_for(chunks.get(), 5), b"retry: 5000\n\n")
+
+        # Published from a worker thread, the way a sync view's on_commit would
+        await asyncio.to_thread(events.get_broker().publish, {"type": "borrow", "id": 7})
+        chunk = await asyncio.wait_for(chunks.get(), 5)
+        self.assertTrue(chunk.startswith(b"event: borrow\ndata: "))
+
+        # A client disconnect cancels the response task
+        consumer.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await consumer
+        self.assertEqual(events.hub._subscribers, {})
+        self.assertEqual(events.hub._watchers, {})
+
+    def test_stream_is_refused_under_wsgi(self):
+        response = self.client.get(reverse('library:dashboard-events'))
+        self.assertEqual(response.status_code, 501)
+        self.assertEqual(events.hub._subscribers, {})
+
+    def test_checkouts_and_returns_are_published_after_commit(self):
+        student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        books = [Book.objects.create(title=f"Live {i}", publication_year=2020, quantity=1) for i in range(2)]
+
+        with mock.patch.object(events.LocalBroker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                borrow_book(student, books[0])
+                return_book(student, books[0])
+                process_carts('borrow', [{"tup_id": student.tup_id, "book_ids": [books[1].pk]}])
+                process_carts('return', [{"tup_id": student.tup_id, "book_ids": [books[1].pk]}])
+                self.assertFalse(publish.called)
+
+        self.assertEqual(
+            [(call.args[0]["type"], call.args[0]["book_title"]) for call in publish.call_args_list],
+            [("borrow", "Live 0"), ("return", "Live 0"), ("borrow", "Live 1"), ("return", "Live 1")],
+        )
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        self.book = Book.objects.create(title="Twice served", publication_year=2020, quantity=2)
+        self.book.author.add(Author.objects.create(name="Writer"))
+        borrow_book(student, self.book)
+
+    async def test_async_views_match_their_sync_counterparts(self):
+        pairs = [
+            (reverse('library:api_book_list') + '?fields=id,title,author', reverse('library:api_async_book_list') + '?fields=id,title,author'),
+            (reverse('library:api_book_detail', args=[self.book.pk]), reverse('library:api_async_book_detail', args=[self.book.pk])),
+            (reverse('library:api_student_history', args=["TUPM-25-0001"]), reverse('library:api_async_student_history', args=["TUPM-25-0001"])),
+            (reverse('library:admin-dashboard'), reverse('library:api_async_admin_dashboard')),
+        ]
+        for sync_url, async_url in pairs:
+            sync_response = await self.async_client.get(sync_url)
+            async_response = await self.async_client.get(async_url)
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual(async_response.json(), sync_response.json())
+
+        missing = await self.async_client.get(reverse('library:api_async_book_detail', args=[999999]))
+        self.assertEqual(missing.status_code, 404)
+
+
+class StudentHistoryTests(TestCase):
+    def setUp(self):
+        self.student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        start = timezone.now() - datetime.timedelta(days=10)
+        for i in range(3):
+            book = Book.objects.create(title=f"Read {i}", publication_year=2020, quantity=1)
+            Borrow.objects.create(borrower=self.student, borrowing=book, borrowed_date=start + datetime.timedelta(days=i), returned=True)
+
+    def test_profile_is_returned_once_with_two_queries(self):
+        with self.assertNumQueries(2):
+            data = self.client.get(reverse('library:api_student_history', args=[self.student.tup_id])).json()
+        self.assertEqual(data["student"], {"tup_id": "TUPM-25-0001", "first": "Ana", "last": "Cruz", "email": "ana@example.com"})
+        self.assertEqual([loan["book_title"] for loan in data["loans"]], ["Read 2", "Read 1", "Read 0"])
+        self.assertIsNone(data["next"])
+
+    def test_loans_page_by_borrowed_date(self):
+        url = reverse('library:api_student_history', args=[self.student.tup_id])
+        # ?page_size= as the paginated API has always taken it; ?limit= is an alias
+        for param in ('page_size', 'limit'):
+            first = self.client.get(url, {param: 2}).json()
+            self.assertEqual(set(first), {"student", "next", "previous", "results"})
+            self.assertIsNone(first["previous"])
+            second = self.client.get(first["next"]).json()
+            self.assertEqual([loan["book_title"] for loan in first["results"] + second["results"]], ["Read 2", "Read 1", "Read 0"])
+            self.assertIsNone(second["next"])
+            self.assertEqual(self.client.get(second["previous"]).json()["results"], first["results"])
+            self.assertEqual(second["student"], first["student"])
+
+        self.assertEqual(len(self.client.get(url, {'page_size': 1}).json()["results"]), 1)
+        async_page = self.client.get(reverse('library:api_async_student_history', args=[self.student.tup_id]), {'page_size': 2}).json()
+        self.assertEqual(async_page["results"], self.client.get(url, {'page_size': 2}).json()["results"])
+        for params in ({'page_size': 'two'}, {'limit': 2, 'cursor': 'bogus'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+        self.assertEqual(self.client.get(reverse('library:api_student_history', args=["TUPM-00-0000"])).status_code, 404)
+
+
+class StudentLookupTests(TestCase):
+    def setUp(self):
+        self.ana = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-24-0001", email="ana@example.com")
+        self.ben = Student.objects.create(first="Ben", last="Reyes", tup_id="TUPM-25-0001", email="ben@example.com")
+
+    def test_short_forms_resolve_through_the_parsed_columns(self):
+        self.assertEqual((self.ben.tup_year, self.ben.tup_serial), (25, 1))
+        self.assertEqual(Student.objects.resolve("TUPM-24-0001"), self.ana)
+        self.assertEqual(Student.objects.resolve("25-0001"), self.ben)
+        self.assertIn("tup_serial", str(Student.objects.matching_tup_id("0001").query))
+        with self.assertRaisesMessage(Student.MultipleObjectsReturned, "TUPM-24-0001, TUPM-25-0001"):
+            Student.objects.resolve("0001")
+        with self.assertRaises(Student.DoesNotExist):
+            Student.objects.resolve("0002")
+
+    def test_views_report_ambiguous_suffixes(self):
+        response = self.client.get(reverse('library:student', args=["0001"]))
+        self.assertContains(response, "Several students match 0001")
+        self.assertContains(response, reverse('library:student', args=["TUPM-25-0001"]))
+
+        response = self.client.post(reverse('library:index'), {"tup_id_year": "24", "tup_id_digits": "0001"})
+        self.assertRedirects(response, reverse('library:student', args=["TUPM-24-0001"]))
+
+        response = self.client.post(
+            reverse('library:api_circulation'), {"action": "return", "tup_id": "0001", "book_ids": []}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('library:api_student_history', args=["24-0001"])).json()["student"]["first"], "Ana")
+
+
+class IndexPageTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        self.book = Book.objects.create(title="Two copies", publication_year=2020, quantity=2)
+
+    def test_book_list_is_cached_per_catalog_version(self):
+        url = reverse('library:index')
+        self.assertContains(self.client.get(url), "Two copies - Available (2 of 2)")
+        # Only the version lookup while the fragment is cached; the POST error branch shares it
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {"tup_id_year": "25", "tup_id_digits": "12"})
+        self.assertContains(response, "Invalid format")
+
+        # One copy out is not "Borrowed" while another is on the shelf
+        with self.captureOnCommitCallbacks(execute=True):
+            borrow_book(self.student, self.book)
+        self.assertContains(self.client.get(url), "Two copies - Available (1 of 2)")
+        with self.captureOnCommitCallbacks(execute=True):
+            borrow_book(Student.objects.create(first="Ben", last="Reyes", tup_id="TUPM-25-0002", email="ben@example.com"), self.book)
+        self.assertContains(self.client.get(url), "Two copies - Borrowed")
+
+
+class BookListQueryTests(TestCase):
+    def add_books(self, count):
+        for _ in range(count):
+            i = Book.objects.count()
+            book = Book.objects.create(title=f"Listed {i}", publication_year=2020, quantity=2)
+            book.author.add(Author.objects.create(name=f"Author {i}"), Author.objects.create(name=f"Coauthor {i}"))
+            student = Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            borrow_book(student, book)
+
+    def test_list_query_count_does_not_grow_with_books(self):
+        url = reverse('library:api_book_list')
+        for count in (1, 9):
+            self.add_books(count - Book.objects.count())
+            get_cache().clear()
+            # version, books with their active_loans column, authors
+            with self.assertNumQueries(3):
+                data = self.client.get(url).json()
+            self.assertEqual(len(data), count)
+            self.assertEqual({(book["available_copies"], len(book["author"])) for book in data}, {(1, 2)})
+
+
+class BookDetailTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.book = Book.objects.create(title="Many copies", publication_year=2020, quantity=5)
+        self.book.author.add(Author.objects.create(name="Writer"))
+
+    def lend(self, count):
+        for i in range(Student.objects.count(), Student.objects.count() + count):
+            student = Student.objects.create(first=f"S{i}", last="Test", tup_id=f"TUPM-25-{i:04d}", email=f"s{i}@example.com")
+            borrow_book(student, self.book)
+
+    def test_detail_query_count_does_not_grow_with_open_loans(self):
+        self.lend(1)
+        api_url = reverse('library:api_book_detail', args=[self.book.pk])
+        # version, book, authors, subjects, open loans with borrowers
+        with self.assertNumQueries(5):
+            self.client.get(api_url)
+        with self.assertNumQueries(4):
+            self.client.get(reverse('library:book', args=[self.book.pk]))
+
+        get_cache().clear()
+        self.lend(2)
+        with self.assertNumQueries(5):
+            data = self.client.get(api_url).json()
+        self.assertEqual((data["status"], data["available_copies"], len(data["active_loans"])), ("Available", 2, 3))
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('library:book', args=[self.book.pk]))
+        self.assertContains(response, "Available (2 of 5)")
+        self.assertContains(response, "Borrowed by:", count=3)
+
+    def test_missing_book_page_is_a_404(self):
+        self.assertEqual(self.client.get(reverse('library:book', args=[999999])).status_code, 404)
+
+
+class QueryRegressionTests(TestCase):
+    """A small seeded library against benchmark_baseline.json (taken by manage.py benchmark_queries)."""
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_seeded_library_is_consistent(self):
+        tables = seeding.seed_library(authors=10, subjects=5, books=40, students=30, borrows=600, seed=1)
+        self.assertEqual(tables['books.Borrow'][0], 600)
+        self.assertEqual(Book.objects.reconcile_active_loans(), 0)
+        self.assertFalse(Borrow.objects.filter(returned=False).values('borrower').annotate(
+            n=Count('id')).filter(n__gt=Borrow.MAX_ACTIVE_LOANS).exists())
+        self.assertEqual(Student.objects.resolve(Student.objects.first().tup_id[5:]).tup_year, 18)
+        self.assertFalse(OutboundEmail.objects.exists())
+        self.assertEqual(Borrow.get_today_borrow_count(), 0)
+
+    def test_seed_command_is_deterministic_and_refuses_to_seed_twice(self):
+        out = StringIO()
+        call_command('seed_library', '--authors=5', '--subjects=3', '--books=20', '--students=10', '--borrows=100', '--seed=7', stdout=out)
+        self.assertIn("Seeded", out.getvalue())
+        self.assertEqual((Book.objects.count(), Student.objects.count(), Borrow.objects.count()), (20, 10, 100))
+        titles = list(Book.objects.order_by('id').values_list('title', flat=True))
+
+        with self.assertRaises(CommandError):
+            call_command('seed_library', '--books=20', '--students=10', stdout=StringIO())
+
+        Borrow.objects.all().delete()
+        Student.objects.all().delete()
+        Book.objects.all().delete()
+        seeding.seed_library(authors=5, subjects=3, books=20, students=10, borrows=100, seed=7)
+        self.assertEqual(list(Book.objects.order_by('id').values_list('title', flat=True)), titles)
+
+    def test_no_endpoint_issues_more_queries_than_the_baseline(self):
+        seeding.seed_library(authors=10, subjects=5, books=40, students=30, borrows=600, seed=1)
+        results = benchmarks.run_suite(repeat=1)
+
+        # Every route in books/urls.py is covered
+        self.assertEqual({result['url'] for result in results.values()} - {None}, {p.name for p in urlpatterns})
+        current = benchmarks.report(results, {}, 1, 1)
+        self.assertEqual(benchmarks.compare(current, benchmarks.load_baseline()), [])
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.student = Student.objects.create(first="Ana", last="Cruz", tup_id="TUPM-25-0001", email="ana@example.com")
+        self.books = [Book.objects.create(title=f"Profiled {i}", publication_year=2020) for i in range(2)]
+
+    def test_fingerprint_collapses_values(self):
+        self.assertEqual(
+            fingerprint("SELECT *  FROM t WHERE id IN (%s, %s, %s) AND name = 'O''Hara' LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?",
+        )
+
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_DUPLICATES=2)
+    def test_timing_header_and_log_line(self):
+        with self.assertLogs('books.middleware', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('library:api_circulation'), {
+                "action": "borrow", "tup_id": self.student.tup_id, "book_ids": [book.pk for book in self.books],
+            }, content_type='application/json')
+
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", serializer;dur=[\d.]+$')
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line["view"], line["status"], line["db_queries"]), ("books.views.CirculationView", 200, len(queries)))
+        # The per-book lookups are reported as a repeated statement
+        self.assertTrue(any('"books_book"' in d["sql"] and d["count"] >= 2 for d in line["duplicates"]))
+
+        with self.assertLogs('books.middleware', 'INFO') as logs:
+            self.client.get(reverse('library:api_book_list'))
+        self.assertGreater(json.loads(logs.records[0].getMessage())["serializer_ms"], 0)
+
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_SLOW_MS=0)
+    def test_slow_requests_are_sampled_with_their_top_queries(self):
+        with self.assertLogs('books.middleware', 'WARNING') as logs:
+            self.client.get(reverse('library:api_student_history', args=[self.student.tup_id]))
+        sample = json.loads(logs.records[0].getMessage())
+        self.assertEqual(sample["view"], "books.views.StudentHistoryView")
+        self.assertTrue(sample["top_queries"])
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('library:api_book_list'))
+        self.assertFalse(response.has_header('Server-Timing'))
@@ -14,14 +14,25 @@ urlpatterns = [
 
     path("api/books/", views.BookListsView.as_view(), name="api_book_list"),
     path("api/books/<int:pk>/", views.BookDetailsView.as_view(), name="api_book_detail"),
+    path("api/cache/metrics/", views.cache_metrics, name="api_cache_metrics"),
+    path("api/search/", views.BookSearchView.as_view(), name="api_book_search"),
     path("api/history/<str:tup_id>/", views.StudentHistoryView.as_view(), name="api_student_history"),
 
+    path("api/changes/", views.ChangesView.as_view(), name="api_changes"),
     path("api/circulation/", views.CirculationView.as_view(), name="api_circulation"),
+    path("api/circulation/batch/", views.BatchCirculationView.as_view(), name="api_circulation_batch"),
 
     path("api/students/", views.StudentListView.as_view(), name="api_student_list"),
 
     path("api/login/", views.loginView.as_view(), name="api_login"),
 
     path('api/admin-dashboard/', views.AdminDashboardView.as_view(), name='admin-dashboard'),
+    path('api/admin-dashboard/events/', views.dashboard_events, name='dashboard-events'),
     path('api/trigger-emails/', views.trigger_overdue_emails, name='trigger-emails'),
+    path('api/jobs/<int:pk>/', views.JobStatusView.as_view(), name='job-status'),
+
+    path("api/async/books/", views.async_book_list, name="api_async_book_list"),
+    path("api/async/books/<int:pk>/", views.async_book_detail, name="api_async_book_detail"),
+    path("api/async/history/<str:tup_id>/", views.async_student_history, name="api_async_student_history"),
+    path("api/async/admin-dashboard/", views.async_admin_dashboard, name="api_async_admin_dashboard"),
 ]
\ No newline at end of file
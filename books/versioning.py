@@ -0,0 +1,46 @@
+"""Strong ETags from DataVersion for polled endpoints.
+
+The ETag is the current version of every data set the view depends on plus
+a hash of the request variant (path, query string, Accept), so it is known
+before the view touches its own queryset. A matching If-None-Match is
+answered with 304 after the single DataVersion lookup; nothing is queried,
+serialized or rendered.
+"""
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.cache import parse_etags
+
+from .models import DataVersion
+
+
+class VersionedETagMixin:
+    """Views list the DataVersion names they depend on in etag_versions.
+
+    Responses whose content also changes with time override etag_extra().
+    """
+    etag_versions = ()
+    version_tag = ''
+
+    def etag_extra(self, request):
+        return ''
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        versions = DataVersion.current(*self.etag_versions)
+        variant = hashlib.md5("|".join([
+            request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), self.etag_extra(request),
+        ]).encode()).hexdigest()[:16]
+        # Also read by CachedResponseMixin, so cached content always matches the version it is served under
+        self.version_tag = "-".join(f"{name}{versions[name]}" for name in self.etag_versions)
+        etag = f'"{self.version_tag}-{variant}"'
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+        return response
@@ -2,100 +2,227 @@ from django_otp.plugins.otp_email.models import EmailDevice
 
 from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
-from datetime import datetime, date
 
-from django.http import HttpResponseRedirect, Http404
+from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 import re
 
-from .models import Borrow, Book, Student
+from .models import BackgroundJob, Borrow, Book, DataVersion, Student
+from .caching import CachedResponseMixin, book_version, is_shared, metrics as cache_metrics_rows
+from .versioning import VersionedETagMixin
+from .circulation import borrow_book, process_carts, return_book
+from .jobs import submit_job
+from .search import search_books
+from .changes import changes_since
+from .events import stream_events
+from .pagination import HistoryCursorPagination, OptInCursorPagination, keyset_page
 
 from rest_framework import generics
-from .serializers import BookDetailsSerializer, LibraryBooksSerializer, StudentHistorySerializer, StudentSerializer
+from .serializers import BackgroundJobSerializer, BookDetailsSerializer, BorrowChangeSerializer, LibraryBooksSerializer, StudentHistorySerializer, StudentSerializer, requested_fields
 
 from rest_framework.views import APIView
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework import status
+from rest_framework.exceptions import NotFound, ParseError
 
 from django.core.exceptions import ValidationError
 
 from django.contrib.auth import authenticate
 
-from django.core.mail import send_mail
-from django.conf import settings 
-
-from django.core.management import call_command
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 
 # Create your views here.
 
-class BookListsView(generics.ListAPIView):
-   queryset = Book.objects.all()
+def catalog_filters(params):
+    """Parse the catalog query params (?title=&author=&subject=&available=&year_min=&year_max=)."""
+    filters = {
+        "title": params.get('title'),
+        "author": params.get('author'),
+        "subject": params.get('subject'),
+        "available": params.get('available', '').lower() in ('1', 'true', 'yes'),
+    }
+    for name in ('year_min', 'year_max'):
+        if params.get(name):
+            try:
+                filters[name] = int(params[name])
+            except ValueError:
+                raise ParseError(f"{name} must be a year")
+    return filters
+
+# Book columns behind each LibraryBooksSerializer field; status and available_copies read active_loans
+CATALOG_COLUMNS = {
+    "id": (), "author": (), "title": ("title",), "cover_image": ("cover_image",), "cover_url": ("cover_url",),
+    "status": ("quantity", "active_loans"), "quantity": ("quantity",), "available_copies": ("quantity", "active_loans"),
+}
+
+def catalog_queryset(request):
+    fields = requested_fields(request)
+    # Only prefetch authors when they are going to be serialized
+    queryset = Book.objects.all() if fields and 'author' not in fields else Book.objects.with_availability()
+    if fields:
+        # ...and only select the columns ?fields= asks for (descriptions and search documents are the bulk of a row)
+        queryset = queryset.only("id", *{column for name in fields for column in CATALOG_COLUMNS.get(name, ())})
+    return queryset.filter_catalog(**catalog_filters(request.query_params)).order_by('id')
+
+class BookListsView(VersionedETagMixin, CachedResponseMixin, generics.ListAPIView):
+   cache_name = "book_list"
+   etag_versions = (DataVersion.CATALOG,)
    serializer_class = LibraryBooksSerializer
+   pagination_class = OptInCursorPagination
+
+   def cache_scopes(self, **kwargs):
+       # The catalog version is already in version_tag
+       return []
 
-class BookDetailsView(generics.RetrieveAPIView):
-    queryset = Book.objects.all()
+   def get_queryset(self):
+       return catalog_queryset(self.request)
+
+class BookDetailsView(CachedResponseMixin, generics.RetrieveAPIView):
+    cache_name = "book_detail"
+    # Five queries however many copies are out: version, book, authors, subjects, open loans with borrowers
+    queryset = Book.objects.with_availability().prefetch_related('subject').with_open_loans()
     serializer_class = BookDetailsSerializer
     lookup_field = "pk"
 
-class StudentHistoryView(generics.ListAPIView):
-    serializer_class = StudentHistorySerializer
+    def cache_scopes(self, **kwargs):
+        return [book_version(kwargs['pk'])]
+
+def cache_metrics(request):
+    # Prometheus text format, e.g. library_response_cache_hits_total{endpoint="book_list"} 42
+    if not is_shared():
+        # Each worker would only count its own requests
+        return JsonResponse({
+            "status": "error",
+            "message": "Cache metrics need a cache shared by every worker; set CACHE_BACKEND.",
+        }, status=501)
+    rows, lines = cache_metrics_rows(), []
+    for metric in ('hits', 'misses', 'not_modified'):
+        lines.append(f"# TYPE library_response_cache_{metric}_total counter")
+        lines += [
+            f'library_response_cache_{metric}_total{{endpoint="{endpoint}"}} {value}'
+            for endpoint, name, value in rows if name == metric
+        ]
+    return HttpResponse("\n".join(lines) + "\n", content_type="text/plain; version=0.0.4")
+
+class BookSearchView(APIView):
+    # ?q=harry pott&page=1&page_size=20 -- ranked, prefix-matched, typo-tolerant
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+            page_size = max(1, min(int(request.query_params.get('page_size', 20)), 100))
+        except ValueError:
+            raise ParseError("page and page_size must be numbers")
+
+        books, total, corrected = search_books(query, offset=(page - 1) * page_size, limit=page_size)
+        return Response({
+            "query": query,
+            "corrected_query": corrected,
+            "count": total,
+            "page": page,
+            "page_size": page_size,
+            "results": LibraryBooksSerializer(books, many=True, context={"request": request}).data,
+        })
+
+class ChangesView(APIView):
+    # ?since=<cursor>&limit=N -- Book and Borrow rows written after the cursor; keep polling
+    # with the returned cursor (immediately while has_more is true)
+    def get(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 200)), 1000))
+            books, borrows, cursor, has_more = changes_since(request.query_params.get('since'), limit)
+        except (ValueError, ValidationError):
+            return Response({"status": "error", "message": "Invalid limit or cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "books": LibraryBooksSerializer(books, many=True, context={"request": request}).data,
+            "borrows": BorrowChangeSerializer(borrows, many=True).data,
+            "cursor": cursor,
+            "has_more": has_more,
+        })
 
-    def get_queryset(self):
-        tup_id = self.kwargs['tup_id']
-        return Borrow.objects.filter(borrower__tup_id=tup_id).order_by('-borrowed_date')
+def history_payload(request, student, loans, paginator=None):
+    """{student, loans, next: None}, or with ?page_size= (alias ?limit=) / ?cursor= the {next, previous, results} page."""
+    payload = {"student": StudentSerializer(student).data}
+    data = StudentHistorySerializer(loans, many=True, context={"request": request}).data
+    if paginator is None:
+        return {**payload, "loans": data, "next": None}
+    return {**payload, "next": paginator.get_next_link(), "previous": paginator.get_previous_link(), "results": data}
+
+def paginate_history(request, student):
+    """(loans, paginator); paginator is None when the client did not ask for a page. Raises ValueError or NotFound."""
+    paginator = HistoryCursorPagination()
+    page = paginator.paginate_queryset(Borrow.objects.history(student), request)
+    if page is None:
+        return Borrow.objects.history(student), None
+    return page, paginator
+
+class StudentHistoryView(APIView):
+    # Profile once plus the loans newest first; ?page_size=N (or ?limit=N) pages them, follow next
+    def get(self, request, tup_id):
+        try:
+            student = Student.objects.resolve(tup_id)
+        except Student.DoesNotExist:
+            return Response({"detail": "Student not found"}, status=status.HTTP_404_NOT_FOUND)
+        except Student.MultipleObjectsReturned as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            loans, paginator = paginate_history(request, student)
+        except (ValueError, NotFound):
+            return Response({"status": "error", "message": "Invalid page size or cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(history_payload(request, student, loans, paginator))
 
 def index(request):
+    error_message = None
     if request.method == "POST":
         year = request.POST.get('tup_id_year', '').strip()
         digits = request.POST.get('tup_id_digits', '').strip()
         if re.match(r'^\d{2}$', year) and re.match(r'^\d{4}$', digits):
-            tup_id = f"TUPM-{year}-{digits}"
             try:
-                Student.objects.get(tup_id=tup_id)
-                return HttpResponseRedirect(reverse('library:student', args=[digits]))
+                student = Student.objects.resolve(f"{year}-{digits}")
+                return HttpResponseRedirect(reverse('library:student', args=[student.tup_id]))
             except Student.DoesNotExist:
                 error_message = "Student ID not found"
+            except Student.MultipleObjectsReturned as e:
+                error_message = str(e)
         else:
             error_message = "Invalid format (select year and enter 4 digits)"
-        return render(request, "books/index.html", {
-            "books": Book.objects.all(),
-            "error_message": error_message
-        })
-    
-    books = Book.objects.all()
-    for book in books:
-        borrow = Borrow.objects.filter(borrowing=book, returned=False).first()
-        book.status = "Borrowed" if borrow else "Available"
-    
+
     return render(request, "books/index.html", {
-        "books": books 
+        # Lazy: only evaluated when the template's cached book list is missing for this version
+        "books": Book.objects.only('id', 'title', 'quantity', 'active_loans').order_by('id'),
+        "catalog_version": DataVersion.current(DataVersion.CATALOG)[DataVersion.CATALOG],
+        "error_message": error_message,
     })
 
 def book(request, book_id):
-    book = Book.objects.get(id=book_id)
+    book = get_object_or_404(Book.objects.prefetch_related('author', 'subject').with_open_loans(), id=book_id)
     now = timezone.now()
-    borrow = Borrow.objects.filter(borrowing=book, returned=False).first()
-
-    if borrow:
+    for borrow in book.open_loans:
         remaining_hours = (borrow.due_date - now).total_seconds() / 3600
         borrow.status = "Overdue" if remaining_hours < 0 else f"{remaining_hours:.1f} hours left"
-    
+
     return render(request, "books/book.html", {
         "book": book,
-        "borrow": borrow
+        "borrows": book.open_loans,
     })
 
 def student(request, tup_id):
+    # tup_id may be the full id or a short form (25-0001, 0001); see StudentQuerySet.matching_tup_id
     try:
-        student = Student.objects.filter(tup_id__endswith=f"-{tup_id}").first()
-        if not student:
-            raise Student.DoesNotExist
+        student = Student.objects.resolve(tup_id)
     except Student.DoesNotExist:
         raise Http404("Student not found")
+    except Student.MultipleObjectsReturned as e:
+        return render(request, "books/student.html", {"tup_id": tup_id, "matches": e.matches})
     
-    borrows = Borrow.objects.filter(borrower=student).order_by('-borrowed_date')
+    borrows = Borrow.objects.filter(borrower=student).select_related('borrowing').order_by('-borrowed_date')
     now = timezone.now()
     for borrow in borrows:
         if not borrow.returned:
@@ -115,7 +242,12 @@ class CirculationView(APIView):
         book_ids = request.data.get('book_ids', [])
 
         #1. FIND STUDENT
-        student = get_object_or_404(Student, tup_id=tup_id)
+        try:
+            student = Student.objects.resolve(tup_id)
+        except Student.DoesNotExist:
+            raise Http404("Student not found")
+        except Student.MultipleObjectsReturned as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         results = []
 
@@ -124,50 +256,24 @@ class CirculationView(APIView):
             book = get_object_or_404(Book, id=book_id)
 
             if action == 'borrow':
-                #CHECK IF BORROWED
-                if Borrow.objects.filter(borrower=student, borrowing=book, returned=False).exists():
-                    results.append(f"❌{book.title}: Already borrowed")
-                    continue
-
-                active_borrows = Borrow.objects.filter(borrowing=book, returned=False).count()
-                if active_borrows >= book.quantity:
-                    results.append(f"⛔ {book.title}: All copies are currently borrowed")
-                    continue
-                
-                borrow_instance=Borrow(borrower=student, borrowing=book)
                 try:
-                    borrow_instance.full_clean()
-                    borrow_instance.save()
-                    if student.email: 
-                        subject = f"Library Receipt: {book.title}"
-                        message = f"""
-                        Hi {student.first},
-                        
-                        You have successfully borrowed: {book.title}
-                        Date: {timezone.now().date()}
-                        Please return it on time!
-                        """
-                        try:
-                            send_mail(
-                                subject,
-                                message,
-                                settings.EMAIL.HOST_USER,
-                                [student.email],
-                                fail_silently=True,
-                            )
-                        except Exception as e:
-                            print(f"Email failed to send: {e}")
+                    borrow_book(student, book)
+                    # The confirmation email is queued by Borrow.save() and sent by process_email_outbox
                     results.append(f"✅ {book.title}: Successfully Borrowed")
                 except ValidationError as e:
-                    error_msg = e.messages[0] if e.messages else "Validation Error"
-                    results.append(f"⛔ {book.title}: Failed - {error_msg}")
+                    #CHECK IF BORROWED / OUT OF COPIES
+                    code = getattr(e, 'code', None)
+                    if code == 'already_borrowed':
+                        results.append(f"❌{book.title}: Already borrowed")
+                    elif code == 'unavailable':
+                        results.append(f"⛔ {book.title}: All copies are currently borrowed")
+                    else:
+                        error_msg = e.messages[0] if e.messages else "Validation Error"
+                        results.append(f"⛔ {book.title}: Failed - {error_msg}")
 
             elif action == 'return':
-                #FIND ACTIVE BORROW BOOKS
-                record = Borrow.objects.filter(borrower=student, borrowing=book, returned=False).first()
-                if record:
-                    record.returned = True
-                    record.save()
+                #CLOSE THE ACTIVE BORROW UNDER A ROW LOCK
+                if return_book(student, book):
                     results.append(f"↩️ {book.title}: Successfully Returned")
                 else:
                     results.append(f"⚠️ {book.title}: Was not borrowed by this student")
@@ -175,9 +281,30 @@ class CirculationView(APIView):
         return Response({"status": "success", "results": results}, status=status.HTTP_200_OK)
 
 
+class BatchCirculationView(APIView):
+    def post(self, request):
+        action = request.data.get('action') #"BORROW" OR "RETURN"
+        carts = request.data.get('carts', []) #[{"tup_id": ..., "book_ids": [...]}, ...]
+
+        if action not in ('borrow', 'return'):
+            return Response({"status": "error", "message": "action must be 'borrow' or 'return'"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(carts, list) or not all(
+            isinstance(cart, dict) and isinstance(cart.get('tup_id'), str) and isinstance(cart.get('book_ids', []), list)
+            for cart in carts
+        ):
+            return Response(
+                {"status": "error", "message": 'carts must be a list of {"tup_id": "...", "book_ids": [...]}'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = process_carts(action, carts)
+        return Response({"status": "success", "results": results}, status=status.HTTP_200_OK)
+
+
 class StudentListView(generics.ListAPIView):
-    queryset=Student.objects.all()
+    queryset=Student.objects.order_by('id')
     serializer_class=StudentSerializer
+    pagination_class=OptInCursorPagination
 
 
 class loginView(APIView):
@@ -212,63 +339,143 @@ class loginView(APIView):
         else: 
             return Response({"status": "error", "message": "Invalid Credentials"}, status=status.HTTP_401_UNAUTHORIZED)
         
-class AdminDashboardView(APIView):
+def format_dashboard_rows(rows, is_overdue=False):
+    data = []
+    for b in rows:
+        # time_left comes from SQL (due_date - now)
+        if is_overdue:
+            days = abs(b["time_left"].days)
+            status_msg = f"Overdue by {days} days" if days > 0 else "Overdue (Today)"
+        else:
+            hours = b["time_left"].total_seconds() / 3600
+            status_msg = f"{hours:.1f} hours left"
+
+        data.append({
+            "id": b["id"],
+            "student_name": b["student_name"],
+            "student_id": b["student_id"],
+            "book_title": b["book_title"],
+            "due_date": b["due_day"].isoformat(),
+            "status": status_msg
+        })
+    return data
+
+class AdminDashboardView(VersionedETagMixin, APIView):
+    # ?limit=N pages each list; follow active_next / overdue_next as ?active_cursor= / ?overdue_cursor=
+    etag_versions = (DataVersion.CIRCULATION,)
+
+    def etag_extra(self, request):
+        # "X.Y hours left" moves every 6 minutes (and loans turn overdue) without any write
+        return str(int(timezone.now().timestamp() // 360))
+
     def get(self, request):
         now = timezone.now()
-        
-        # 1. Get the lists from the database
-        active_borrows = Borrow.objects.filter(returned=False, due_date__gte=now).order_by('due_date')
-        overdue_borrows = Borrow.objects.filter(returned=False, due_date__lt=now).order_by('due_date')
-        
-        def format_borrows(queryset, is_overdue=False):
-            data = []
-            for b in queryset:
-                try:
-                    # --- 1. DATE FIX (Handle mismatch types) ---
-                    due = b.due_date
-                    if type(due) is date:
-                        due = timezone.make_aware(datetime.combine(due, datetime.min.time()))
-                    
-                    # --- 2. NAME FIX (The cause of your empty list) ---
-                    # We try 'first'/'last' (your model), fallback to 'first_name' if changed
-                    f_name = getattr(b.borrower, 'first', getattr(b.borrower, 'first_name', 'Unknown'))
-                    l_name = getattr(b.borrower, 'last', getattr(b.borrower, 'last_name', 'Student'))
-                    full_name = f"{f_name} {l_name}"
-
-                    # --- 3. CALCULATE STATUS ---
-                    time_diff = due - now
-                    if is_overdue:
-                        days = abs(time_diff.days)
-                        status_msg = f"Overdue by {days} days" if days > 0 else "Overdue (Today)"
-                    else:
-                        hours = time_diff.total_seconds() / 3600
-                        status_msg = f"{hours:.1f} hours left"
-
-                    data.append({
-                        "id": b.id,
-                        "student_name": full_name,
-                        "student_id": b.borrower.tup_id,
-                        "book_title": b.borrowing.title,
-                        "due_date": b.due_date.strftime("%Y-%m-%d"),
-                        "status": status_msg
-                    })
-                except Exception as e:
-                    print(f"Error formatting borrow ID {b.id}: {e}")
-                    # We continue to the next item instead of crashing
-                    continue
-                    
-            return data
+        rows = Borrow.objects.dashboard_rows(now)
+
+        limit = request.query_params.get('limit')
+        if limit is None:
+            # 1. One query for every open loan, split into the two lists in order
+            active, overdue = [], []
+            for row in rows:
+                (overdue if row["is_overdue"] else active).append(row)
+            return Response({
+                "active": format_dashboard_rows(active, is_overdue=False),
+                "overdue": format_dashboard_rows(overdue, is_overdue=True)
+            })
+
+        # 2. Paged: one keyset query per list
+        try:
+            limit = max(1, min(int(limit), 500))
+            active, active_next = keyset_page(rows.filter(due_date__gte=now), 'due_date', request.query_params.get('active_cursor'), limit)
+            overdue, overdue_next = keyset_page(rows.filter(due_date__lt=now), 'due_date', request.query_params.get('overdue_cursor'), limit)
+        except (ValueError, ValidationError):
+            return Response({"status": "error", "message": "Invalid limit or cursor"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({
-            "active": format_borrows(active_borrows, is_overdue=False),
-            "overdue": format_borrows(overdue_borrows, is_overdue=True)
+            "active": format_dashboard_rows(active, is_overdue=False),
+            "overdue": format_dashboard_rows(overdue, is_overdue=True),
+            "active_next": active_next,
+            "overdue_next": overdue_next,
         })
 
+async def dashboard_events(request):
+    # Server-sent events (borrow / return / overdue / resync) for AdminDashboardView; served by library/asgi.py
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the endless stream would pin a sync worker per open tab
+        return JsonResponse({
+            "status": "error",
+            "message": "Live events need the ASGI server; poll /api/admin-dashboard/ instead.",
+        }, status=501)
+    response = StreamingHttpResponse(stream_events(), content_type="text/event-stream")
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# --- Async (ASGI-native) read-only API ---
+# Same payloads as the sync views, read with the async ORM so a worker under
+# library/asgi.py is never parked on a thread while the database answers.
+# Only the history view pages (?limit=&cursor=, as in sync); cursor paging of the
+# catalog, the response cache and the version ETags stay on the sync routes.
+
+def api_json(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+async def async_book_list(request):
+    # Serializers read ?fields= from a DRF request
+    request = Request(request)
+    try:
+        queryset = catalog_queryset(request)
+    except ParseError as e:
+        return api_json({"detail": e.detail}, status=400)
+    books = [book async for book in queryset.aiterator(chunk_size=500)]
+    return api_json(LibraryBooksSerializer(books, many=True, context={"request": request}).data)
+
+async def async_book_detail(request, pk):
+    request = Request(request)
+    try:
+        book = await Book.objects.with_availability().prefetch_related('subject').with_open_loans().aget(pk=pk)
+    except Book.DoesNotExist:
+        return api_json({"detail": "No Book matches the given query."}, status=404)
+    return api_json(BookDetailsSerializer(book, context={"request": request}).data)
+
+async def async_student_history(request, tup_id):
+    request = Request(request)
+    try:
+        student = await Student.objects.aresolve(tup_id)
+    except Student.DoesNotExist:
+        return api_json({"detail": "Student not found"}, status=404)
+    except Student.MultipleObjectsReturned as e:
+        return api_json({"status": "error", "message": str(e)}, status=400)
+
+    try:
+        # CursorPagination is sync; the page is one query
+        loans, paginator = await sync_to_async(paginate_history)(request, student)
+        if paginator is None:
+            loans = [loan async for loan in loans]
+    except (ValueError, NotFound):
+        return api_json({"status": "error", "message": "Invalid page size or cursor"}, status=400)
+    return api_json(history_payload(request, student, loans, paginator))
+
+async def async_admin_dashboard(request):
+    active, overdue = [], []
+    async for row in Borrow.objects.dashboard_rows(timezone.now()):
+        (overdue if row["is_overdue"] else active).append(row)
+    return api_json({
+        "active": format_dashboard_rows(active, is_overdue=False),
+        "overdue": format_dashboard_rows(overdue, is_overdue=True),
+    })
+
 @api_view(['POST'])
 def trigger_overdue_emails(request):
-    try:
-        # Run the management command manually
-        call_command('send_overdue_notices')
-        return Response({'status': 'success', 'message': 'Overdue emails have been sent successfully!'}, status=200)
-    except Exception as e:
-        return Response({'status': 'error', 'message': str(e)}, status=500)
\ No newline at end of file
+    # Runs send_overdue_notices on the background job thread; poll api/jobs/<id>/ for progress
+    job = submit_job('send_overdue_notices')
+    return Response({
+        'status': 'accepted',
+        'message': 'Overdue emails are being sent.',
+        'job_id': job.pk,
+    }, status=status.HTTP_202_ACCEPTED)
+
+class JobStatusView(generics.RetrieveAPIView):
+    queryset = BackgroundJob.objects.all()
+    serializer_class = BackgroundJobSerializer
+    lookup_field = "pk"
\ No newline at end of file
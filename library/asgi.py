@@ -3,6 +3,14 @@ ASGI config for library project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with uvicorn workers so the dashboard event streams
+(books/events.py) park on the event loop instead of holding a thread each:
+
+    gunicorn library.asgi:application -k uvicorn.workers.UvicornWorker
+
+Under library/wsgi.py the events route answers 501 rather than tie up a
+sync worker per open dashboard.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -155,6 +155,7 @@
 
 
 import os
+import tempfile
 from pathlib import Path
 import dj_database_url # Import this
 
@@ -188,6 +189,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    # First so its timings cover the rest of the chain; removes itself unless REQUEST_PROFILING is set
+    'books.middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # Add this right after SecurityMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -230,6 +233,58 @@ DATABASES = {
     )
 }
 
+# Seconds a write waits for a lock before it fails. Also bounds how long a row
+# can sit stamped but uncommitted, so books/changes.py holds rows back this long
+DATABASE_LOCK_TIMEOUT = 20
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # WAL lets readers run alongside a writer; IMMEDIATE takes the write lock at
+    # BEGIN, which is SQLite's equivalent of the row locks circulation relies on
+    DATABASES['default']['OPTIONS'] = {
+        'init_command': 'PRAGMA journal_mode=WAL;',
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': DATABASE_LOCK_TIMEOUT,
+    }
+    # File-backed test database so threaded tests get real locking; kept out of the checkout
+    DATABASES['default']['TEST'] = {'NAME': os.path.join(tempfile.gettempdir(), 'library_test_db.sqlite3')}
+elif DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    # Postgres waits on row locks forever by default
+    DATABASES['default']['OPTIONS'] = {'options': f'-c lock_timeout={DATABASE_LOCK_TIMEOUT}s'}
+
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at Redis or
+# Memcached to share the catalog response cache between workers. Entries are
+# keyed on DataVersion, so a local cache is never stale, only colder; the
+# cache metrics endpoint needs a shared one
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'library'),
+    }
+}
+CATALOG_CACHE = 'default'
+
+# Carries dashboard events between worker processes (books/events.py); the
+# local broker only reaches streams served by the publishing process
+EVENT_BROKER = os.environ.get('EVENT_BROKER', 'books.events.LocalBroker')
+
+# Per-request Server-Timing headers and JSON log lines (books/middleware.py).
+# Off unless REQUEST_PROFILING=1; when off the middleware drops out of the chain
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING') == '1'
+# Same-fingerprint statements per request reported as a likely N+1
+REQUEST_PROFILING_DUPLICATES = 5
+# Requests to books/views.py slower than this get their top queries logged, at this sample rate
+REQUEST_PROFILING_SLOW_MS = int(os.environ.get('REQUEST_PROFILING_SLOW_MS', 500))
+REQUEST_PROFILING_SAMPLE_RATE = float(os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 1.0))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'books.middleware': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},